@@ -0,0 +1,48 @@
+"""Cold-start benchmark for calculo.
+
+Each run starts a fresh interpreter and times `import calculo` and the first
+`calculo.initialize()` (config load) separately, then reports the best and the
+median over all runs. Usage:
+
+    python bench_import.py [runs] [config.json]
+"""
+import statistics
+import subprocess
+import sys
+
+_SNIPPET = """
+import time
+t0 = time.perf_counter()
+import calculo
+t1 = time.perf_counter()
+calculo.initialize({config!r})
+t2 = time.perf_counter()
+import sys
+print(t1 - t0, t2 - t1, "sklearn" in sys.modules)
+"""
+
+
+def run_once(config):
+    out = subprocess.run(
+        [sys.executable, "-c", _SNIPPET.format(config=config)],
+        check=True, capture_output=True, text=True
+    ).stdout.split()
+    return float(out[-3]), float(out[-2]), out[-1] == "True"
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    config = sys.argv[2] if len(sys.argv) > 2 else "tanks_config.json"
+    imports, inits, sklearn_loaded = [], [], False
+    for _ in range(runs):
+        t_import, t_init, sk = run_once(config)
+        imports.append(t_import)
+        inits.append(t_init)
+        sklearn_loaded |= sk
+    for name, vals in (("import calculo", imports), ("initialize()", inits)):
+        print(f"{name:15s} best {1e3 * min(vals):8.2f} ms   median {1e3 * statistics.median(vals):8.2f} ms")
+    print(f"sklearn imported at startup: {sklearn_loaded}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,8 @@ package.domain = org.tankcalc
 # Código fuente
 source.dir = .
 source.include_exts = py,png,jpg,kv,atlas,json
+# Scripts de desarrollo que no van en el APK
+source.exclude_patterns = bench_*.py
 
 # Versión
 version = 1.0.0
@@ -5,15 +5,25 @@ except Exception as e:
         "numpy is required to run this script. Install it with `pip install numpy` and try again"
     ) from e
 
-try:
-    from sklearn.ensemble import RandomForestRegressor
-    SKLEARN_AVAILABLE = True
-except Exception:
-    SKLEARN_AVAILABLE = False
+import importlib.util
+
+# sklearn tarda segundos en importarse (sobre todo en Android): solo se comprueba que esté
+# instalado y se importa la primera vez que se entrena un bosque (_random_forest_class).
+SKLEARN_AVAILABLE = importlib.util.find_spec("sklearn") is not None
 
 import csv
 import os
 import json
+import atexit
+import collections
+import hashlib
+import itertools
+import pickle
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+from concurrent.futures import Future, ThreadPoolExecutor
 
 # --- misma función exacta de antes ---
 D = 45.0
@@ -21,18 +31,121 @@ R = D / 2.0
 L = 71.0
 GAL_POR_IN3 = 1.0 / 231.0
 
+# Tipos de modelo soportados. model_type None = automático (sklearn_rf si está disponible, si no interp)
+MODEL_TYPES = ("sklearn_rf", "interp", "residual", "isotonic")
+# Configuración de entrenamiento por tanque. Los hiperparámetros del bosque solo aplican a sklearn_rf;
+# n_jobs=-1 usa todos los núcleos. prior_samples = muestras analíticas equiespaciadas que se generan
+# al entrenar (no se guardan) y se suman a los puntos medidos; 0 = entrenar solo con lo medido.
+DEFAULT_TRAINING_CONFIG = {
+    "model_type": None,
+    "n_estimators": 200,
+    "max_depth": None,
+    "min_samples_leaf": 1,
+    "n_jobs": None,
+    "prior_samples": 361
+}
+
+# Tipo de los puntos medidos en memoria; np.float32 reduce la memoria a la mitad a costa de
+# precisión (~7 cifras). En disco siempre se guardan como float64.
+TRAINING_DTYPE = np.float64
+
+class Tank:
+    """One tank record. Fields live in __slots__ and are also reachable dict-style
+    (tank["D"], tank.get(...), {**tank}) as in the original dict records.
+    The measured points are kept in one (2, capacity) array [heights; gallons] whose
+    capacity doubles when full, so appends are amortized O(1) per point.
+    _training_heights and _training_galones are zero-copy views of the filled part;
+    appends never write below the current length and clear_points() allocates a new
+    buffer, so views handed out earlier never change.
+    """
+    # _puntos is the pair (buffer, filled length), replaced as a whole so that lock-free
+    # readers never combine one buffer with the length of another
+    __slots__ = ("D", "L", "R", "name", "modelo", "modelo_type", "training_config", "_tabla",
+                 "_puntos", "cache_key")
+    _KEYS = ("D", "L", "R", "name", "_training_heights", "_training_galones", "modelo",
+             "modelo_type", "training_config", "_tabla")
+    _SETTABLE = ("D", "L", "R", "name", "modelo", "modelo_type", "training_config", "_tabla")
+
+    def __init__(self, name, diameter, length, training_config=None, modelo_type=None, datos=None):
+        self.name = name
+        self.D = float(diameter)
+        self.L = float(length)
+        self.R = self.D / 2.0
+        self.modelo = None
+        self.cache_key = None   # disk-cache entry of the installed model (see _retire_cached_model)
+        self.modelo_type = modelo_type
+        self.training_config = {**DEFAULT_TRAINING_CONFIG, **(training_config or {})}
+        self._tabla = None
+        self.set_points(datos)
+
+    def set_points(self, datos=None):
+        """Replace the dataset with a (2, n) array (None = empty). A float64 array of the
+        right dtype (e.g. memory-mapped from disk) is used as is, without copying."""
+        if datos is None:
+            datos = np.empty((2, 0), dtype=TRAINING_DTYPE)
+        datos = np.asarray(datos, dtype=TRAINING_DTYPE)
+        self._puntos = (datos, datos.shape[1])
+
+    def clear_points(self):
+        self.set_points(None)
+
+    def append_points(self, heights, gallons):
+        h = np.asarray(heights, dtype=TRAINING_DTYPE).reshape(-1)
+        g = np.asarray(gallons, dtype=TRAINING_DTYPE).reshape(-1)
+        k = min(h.shape[0], g.shape[0])
+        datos, n = self._puntos
+        if n + k > datos.shape[1] or not datos.flags.writeable:
+            # read-only (memory-mapped) or full: move to a buffer with room to grow
+            nuevo = np.empty((2, max(n + k, 2 * n, 16)), dtype=TRAINING_DTYPE)
+            nuevo[:, :n] = datos[:, :n]
+            datos = nuevo
+        datos[0, n:n + k] = h[:k]
+        datos[1, n:n + k] = g[:k]
+        self._puntos = (datos, n + k)
+
+    def points(self):
+        """(heights, gallons) views of the measured points, always of equal length."""
+        datos, n = self._puntos
+        return datos[0, :n], datos[1, :n]
+
+    @property
+    def n_points(self):
+        return self._puntos[1]
+
+    @property
+    def _training_heights(self):
+        return self.points()[0]
+
+    @property
+    def _training_galones(self):
+        return self.points()[1]
+
+    def __getitem__(self, key):
+        if key not in self._KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        # the dataset changes only through set_points/append_points/clear_points
+        if key not in self._SETTABLE:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self._KEYS
+
+    def get(self, key, default=None):
+        return self[key] if key in self._KEYS else default
+
+    def keys(self):
+        return self._KEYS
+
+    def items(self):
+        return [(k, self[k]) for k in self._KEYS]
+
 # Multi-tank system storage
 _tanks = {
-    "default": {
-        "D": D,
-        "L": L,
-        "R": R,
-        "name": "Tanque Principal 45x71",
-        "_training_heights": [],
-        "_training_galones": [],
-        "modelo": None,
-        "modelo_type": None
-    }
+    "default": Tank("Tanque Principal 45x71", D, L)
 }
 _current_tank_id = "default"
 
@@ -55,100 +168,839 @@ def galones_por_altura(h, diameter=None, length=None):
     vol_in3 = area_seg * _L
     return vol_in3 * GAL_POR_IN3
 
+def galones_por_altura_array(h, diameter=None, length=None):
+    """Vectorized version of galones_por_altura.
+    h, diameter and length may be scalars or numpy arrays; they are broadcast together
+    and evaluated in a single masked pass. Returns a float array with the broadcast shape.
+    """
+    _D = np.asarray(diameter if diameter is not None else D, dtype=float)
+    _L = np.asarray(length if length is not None else L, dtype=float)
+    h, _D, _L = np.broadcast_arrays(np.asarray(h, dtype=float), _D, _L)
+    _R = _D / 2.0
+
+    vacio = h <= 0
+    lleno = h >= _D
+    # clip so arccos stays in its domain for the masked-out entries
+    y = _R - np.clip(h, 0.0, _D)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        theta = 2.0 * np.arccos(y / _R)
+    area_seg = (_R**2 / 2.0) * (theta - np.sin(theta))
+    area_seg = np.where(lleno, np.pi * _R**2, area_seg)
+    area_seg = np.where(vacio, 0.0, area_seg)
+    vol_in3 = area_seg * _L
+    return vol_in3 * GAL_POR_IN3
+
+def altura_por_galones(g, diameter=None, length=None, tol=1e-9, max_iter=50):
+    """Inverse of galones_por_altura: height (inches) at which the tank holds g gallons.
+    g, diameter and length may be scalars or numpy arrays (broadcast together).
+    Solves theta - sin(theta) = 2*A/R**2 for the central angle with Newton steps, safeguarded
+    by a bisection bracket on [0, 2*pi] and started from the cubic small-angle estimate, for
+    the whole array at once. Stops when every height has moved less than tol inches
+    (typically 4-6 iterations); max_iter bounds the work. Gallons outside [0, capacity] are clipped;
+    NaN gallons give a NaN height.
+    """
+    _D = np.asarray(diameter if diameter is not None else D, dtype=float)
+    _L = np.asarray(length if length is not None else L, dtype=float)
+    g, _D, _L = np.broadcast_arrays(np.asarray(g, dtype=float), _D, _L)
+    _R = _D / 2.0
+    capacidad = np.pi * _R**2 * _L * GAL_POR_IN3
+    # NaN would end up at the bisection midpoint (R); solved as 0 and masked at the end
+    nulo = np.isnan(g)
+    g = np.clip(np.where(nulo, 0.0, g), 0.0, capacidad)
+
+    # theta - sin(theta) = c, c en [0, 2*pi]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        c = np.where(capacidad > 0, 2.0 * np.pi * g / capacidad, 0.0)
+    # theta - sin(theta) ~ theta**3/6 cerca de vacío (y simétrico cerca de lleno)
+    theta = np.where(c < np.pi, np.cbrt(6.0 * c), 2.0 * np.pi - np.cbrt(6.0 * (2.0 * np.pi - c)))
+    lo = np.zeros_like(c)
+    hi = np.full_like(c, 2.0 * np.pi)
+    for _ in range(max_iter):
+        f = theta - np.sin(theta) - c
+        lo = np.where(f <= 0, theta, lo)
+        hi = np.where(f >= 0, theta, hi)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            theta_new = theta - f / (1.0 - np.cos(theta))
+        fuera = ~np.isfinite(theta_new) | (theta_new < lo) | (theta_new > hi)
+        theta_new = np.where(fuera, 0.5 * (lo + hi), theta_new)
+        # dh/dtheta = R/2 * sin(theta/2) <= R/2
+        paso = np.abs(theta_new - theta) * _R / 2.0
+        theta = theta_new
+        if np.all((paso <= tol) | ((hi - lo) * _R / 2.0 <= tol)):
+            break
+    h = np.where(nulo, np.nan, _R * (1.0 - np.cos(theta / 2.0)))
+    if np.ndim(h) == 0:
+        return float(h)
+    return h
+
 # --- entrenamiento del modelo de ML ---
 # Training data: start with analytic samples
 
+class _InterpModel:
+    """Piecewise-linear interpolation model. Used when sklearn is not available or when
+    a tank's training_config asks for "interp", and supports incremental updates via insert().
+    """
+    def __init__(self, x_vals, y_vals, _sorted=False):
+        x = np.asarray(x_vals, dtype=float).reshape(-1)
+        y = np.asarray(y_vals, dtype=float).reshape(-1)
+        if not _sorted:
+            # np.interp needs increasing x
+            orden = np.argsort(x, kind="stable")
+            x = x[orden]
+            y = y[orden]
+        self.x = x
+        self.y = y
+
+    def predict(self, xq):
+        return np.interp(np.asarray(xq, dtype=float).reshape(-1), self.x, self.y)
+
+    def insert(self, x_vals, y_vals):
+        """Return a new model with the points added by sorted insertion.
+        Costs O(k log n) searches plus one array copy instead of a refit, and gives exactly
+        the same arrays as rebuilding from the full dataset (new points go after equal x).
+        """
+        x_new = np.asarray(x_vals, dtype=float).reshape(-1)
+        y_new = np.asarray(y_vals, dtype=float).reshape(-1)
+        orden = np.argsort(x_new, kind="stable")
+        x_new = x_new[orden]
+        y_new = y_new[orden]
+        idx = np.searchsorted(self.x, x_new, side="right")
+        return _InterpModel(np.insert(self.x, idx, x_new), np.insert(self.y, idx, y_new), _sorted=True)
+
+class _ResidualModel:
+    """Analytic volume galones_por_altura(h, D, L) plus a piecewise-linear correction
+    fitted on the calibration points. Fitting is a sort and a group-by; memory is one
+    residual per distinct calibration height."""
+    def __init__(self, diameter, length, x_vals, y_vals):
+        self.D = float(diameter)
+        self.L = float(length)
+        x = np.asarray(x_vals, dtype=float).reshape(-1)
+        y = np.asarray(y_vals, dtype=float).reshape(-1)
+        residuos = y - galones_por_altura_array(x, diameter=self.D, length=self.L)
+        # average the residuals of repeated heights
+        self.x, inv = np.unique(x, return_inverse=True)
+        self.r = np.bincount(inv, weights=residuos) / np.bincount(inv)
+        # the correction is anchored to zero at the empty (h=0) and full (h=D) tank, so it
+        # fades out between the outermost calibration points and the ends of the tank
+        if not self.x.size or self.x[0] > 0.0:
+            self.x = np.concatenate([[0.0], self.x])
+            self.r = np.concatenate([[0.0], self.r])
+        if self.x[-1] < self.D:
+            self.x = np.concatenate([self.x, [self.D]])
+            self.r = np.concatenate([self.r, [0.0]])
+
+    def predict(self, xq):
+        x = np.asarray(xq, dtype=float).reshape(-1)
+        base = galones_por_altura_array(x, diameter=self.D, length=self.L)
+        return base + np.interp(x, self.x, self.r)
+
+def _pool_adjacent_violators(y, w):
+    """Weighted isotonic (non-decreasing) least-squares fit of y, in O(n) amortized."""
+    vals = []
+    wts = []
+    cnts = []
+    for v, wi in zip(y.tolist(), w.tolist()):
+        c = 1
+        # merge with previous blocks while they violate monotonicity
+        while vals and vals[-1] > v:
+            pw = wts.pop()
+            v = (vals.pop() * pw + v * wi) / (pw + wi)
+            wi += pw
+            c += cnts.pop()
+        vals.append(v)
+        wts.append(wi)
+        cnts.append(c)
+    return np.repeat(np.array(vals, dtype=float), cnts)
+
+class _IsotonicModel:
+    """Monotone calibration curve: isotonic regression (pool-adjacent-violators) on the
+    sorted data, served by linear interpolation between the fitted points, so volume never
+    decreases with height. Predictions use np.interp (binary search per query)."""
+    def __init__(self, x_vals, y_vals):
+        x = np.asarray(x_vals, dtype=float).reshape(-1)
+        y = np.asarray(y_vals, dtype=float).reshape(-1)
+        # group repeated heights; the counts become PAV weights
+        self.x, inv = np.unique(x, return_inverse=True)
+        pesos = np.bincount(inv).astype(float)
+        medias = np.bincount(inv, weights=y) / pesos
+        self.y = _pool_adjacent_violators(medias, pesos)
+
+    def predict(self, xq):
+        return np.interp(np.asarray(xq, dtype=float).reshape(-1), self.x, self.y)
+
+def _random_forest_class():
+    from sklearn.ensemble import RandomForestRegressor
+    return RandomForestRegressor
+
 # Modelo de regresión (usamos RandomForest si está disponible, si no usamos un polinomio de numpy como fallback)
-def _train_model_from_data(heights, gals, n_estimators=200):
+def _analytic_prior(diameter, length, n_samples):
+    """n_samples equally spaced analytic (height, gallons) samples of a tank. Generated on
+    demand from the dimensions; never stored with the measured points."""
+    alturas = np.linspace(0.0, diameter, n_samples)
+    return alturas, galones_por_altura_array(alturas, diameter=diameter, length=length)
+
+def _train_model_from_data(heights, gals, n_estimators=200, model_type=None, diameter=None, length=None,
+                           max_depth=None, min_samples_leaf=1, n_jobs=None, prior_samples=0):
     """Train a model from numpy arrays or lists of heights and gallons.
+    model_type selects the family (see MODEL_TYPES); None picks sklearn_rf when available.
+    diameter and length (default: current tank) are used by the "residual" model and the prior.
+    n_estimators, max_depth, min_samples_leaf and n_jobs are passed to RandomForestRegressor.
+    prior_samples analytic samples are added to the data for every family except "residual",
+    which already starts from the analytic volume and is fitted on the given points only.
     Returns (model, model_type) where model has a predict method or callable behavior similar to sklearn.
     """
-    _x = np.array(heights).reshape(-1, 1)
-    _y = np.array(gals).flatten()
-    if SKLEARN_AVAILABLE:
-        model = RandomForestRegressor(
+    _D = diameter if diameter is not None else D
+    _L = length if length is not None else L
+    _x = np.array(heights, dtype=float).reshape(-1, 1)
+    _y = np.array(gals, dtype=float).flatten()
+    if model_type is None:
+        model_type = "sklearn_rf"
+    if prior_samples and model_type != "residual":
+        prior_h, prior_g = _analytic_prior(_D, _L, prior_samples)
+        _x = np.concatenate([prior_h.reshape(-1, 1), _x])
+        _y = np.concatenate([prior_g, _y])
+    if model_type == "residual":
+        model = _ResidualModel(_D, _L, _x, _y)
+    elif model_type == "isotonic":
+        model = _IsotonicModel(_x, _y)
+    elif model_type == "sklearn_rf" and SKLEARN_AVAILABLE:
+        model = _random_forest_class()(
             n_estimators=n_estimators,
+            max_depth=max_depth,
+            min_samples_leaf=min_samples_leaf,
+            n_jobs=n_jobs,
             random_state=42
         )
         model.fit(_x, _y)
         model_type = "sklearn_rf"
     else:
         # fallback: interpolation
-        class _InterpModel:
-            def __init__(self, x_vals, y_vals):
-                self.x = np.array(x_vals)
-                self.y = np.array(y_vals)
-
-            def predict(self, xq):
-                arr = np.asarray(xq).reshape(-1)
-                # for single float
-                return np.array([np.interp(float(v), self.x, self.y) for v in arr])
-
         model = _InterpModel(_x.flatten(), _y)
         model_type = "interp"
     return model, model_type
 
+# --- caché en disco de modelos entrenados ---
+# Directorio junto al archivo de configuración (lo fija load_tanks_config). None = sin caché.
+_model_cache_dir = None
+_MODEL_CACHE_VERSION = 2
+MODEL_CACHE_MAX_ENTRIES = 64
+MODEL_CACHE_MAX_BYTES = 128 * 1024 * 1024
+_model_cache_lock = threading.Lock()
+_sklearn_version = None
+
+def _sklearn_version_string():
+    """Installed scikit-learn version ("" if unknown); pickled forests are tied to it."""
+    global _sklearn_version
+    if _sklearn_version is None:
+        # importlib.metadata is only needed once a forest is cached
+        import importlib.metadata
+        try:
+            _sklearn_version = importlib.metadata.version("scikit-learn")
+        except importlib.metadata.PackageNotFoundError:
+            _sklearn_version = ""
+    return _sklearn_version
+
+def _model_cache_key(tank):
+    """Content hash of everything that determines a trained model: D, L, the training
+    arrays, the training configuration and the scikit-learn version. None for the
+    interp, residual and isotonic families, which refit faster than a cache round trip."""
+    if not SKLEARN_AVAILABLE or tank["training_config"]["model_type"] not in (None, "sklearn_rf"):
+        return None
+    digest = hashlib.sha256()
+    digest.update(json.dumps({
+        "version": _MODEL_CACHE_VERSION,
+        "sklearn": _sklearn_version_string(),
+        "training_config": tank["training_config"]
+    }, sort_keys=True).encode("utf-8"))
+    digest.update(np.array([tank["D"], tank["L"]], dtype=np.float64).tobytes())
+    digest.update(np.asarray(tank["_training_heights"], dtype=np.float64).tobytes())
+    digest.update(np.asarray(tank["_training_galones"], dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+def _load_cached_model(key):
+    """Return (model, model_type) from the disk cache, or None on a miss."""
+    if _model_cache_dir is None or key is None:
+        return None
+    path = os.path.join(_model_cache_dir, key + ".pkl")
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as fh:
+            model, model_type = pickle.load(fh)
+        # mtime marks recent use for eviction
+        os.utime(path)
+        return model, model_type
+    except Exception as e:
+        print(f"Discarding unreadable cached model {path}: {e}")
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+
+def _store_cached_model(key, model, model_type):
+    """Write a trained model to the disk cache and evict the least recently used entries."""
+    if _model_cache_dir is None or key is None:
+        return
+    try:
+        os.makedirs(_model_cache_dir, exist_ok=True)
+        path = os.path.join(_model_cache_dir, key + ".pkl")
+        # per-thread temp name: several threads may store the same key at once
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as fh:
+            pickle.dump((model, model_type), fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        _evict_model_cache()
+    except Exception as e:
+        print(f"Could not cache trained model: {e}")
+
+def _evict_model_cache():
+    # one evictor at a time; entries may still vanish under us (other processes, retired keys)
+    with _model_cache_lock:
+        entries = []
+        for fname in os.listdir(_model_cache_dir):
+            if fname.endswith(".pkl"):
+                try:
+                    st = os.stat(os.path.join(_model_cache_dir, fname))
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, fname))
+        entries.sort(reverse=True)  # most recently used first
+        total = 0
+        for i, (_, size, fname) in enumerate(entries):
+            total += size
+            if i >= MODEL_CACHE_MAX_ENTRIES or total > MODEL_CACHE_MAX_BYTES:
+                _remove_cached_model(fname[:-4])
+
+def _remove_cached_model(key):
+    try:
+        os.remove(os.path.join(_model_cache_dir, key + ".pkl"))
+    except FileNotFoundError:
+        pass
+
+def _retire_cached_model(tank, key):
+    """Record the cache key of a tank's newly installed model and delete the entry of the
+    model it replaces, unless another tank still uses that entry."""
+    anterior, tank.cache_key = tank.cache_key, key
+    if anterior is None or anterior == key or _model_cache_dir is None:
+        return
+    if any(t.cache_key == anterior for t in list(_tanks.values())):
+        return
+    try:
+        _remove_cached_model(anterior)
+    except OSError as e:
+        print(f"Could not remove cached model {anterior}: {e}")
+
+def _fit_tank_model(tank):
+    """Fit (or fetch from the disk cache) a model for a tank record without modifying it.
+    Returns (model, model_type, cache key or None)."""
+    key = _model_cache_key(tank)
+    cached = _load_cached_model(key)
+    if cached is not None:
+        model, model_type = cached
+    else:
+        model, model_type = _train_model_from_data(
+            tank["_training_heights"],
+            tank["_training_galones"],
+            diameter=tank["D"],
+            length=tank["L"],
+            **tank["training_config"]
+        )
+        _store_cached_model(key, model, model_type)
+    return model, model_type, key
+
+def _train_tank(tank):
+    """(Re)train a tank's model from its dataset using the tank's training_config.
+    Reuses a model from the disk cache when the training-data hash matches."""
+    model, model_type, key = _fit_tank_model(tank)
+    _retire_cached_model(tank, key)
+    # a single store of "modelo" is what readers see; they never depend on modelo_type
+    tank["modelo_type"] = model_type
+    tank["modelo"] = model
+    _invalidate_strapping_table(tank)
+    return model, model_type
+
+def _has_training_data(tank):
+    """True if the tank has measured points or an analytic prior to train on."""
+    return len(tank["_training_heights"]) > 0 or tank["training_config"]["prior_samples"] > 0
+
+def _ensure_model(tank):
+    """Train the tank's model on first use. Models are built lazily so that loading or
+    creating tanks only stores their data. Returns the (possibly just trained) model."""
+    global modelo, modelo_type
+    if tank["modelo"] is None and _has_training_data(tank):
+        model, model_type = _train_tank(tank)
+        if tank is _tanks.get(_current_tank_id):
+            modelo = model
+            modelo_type = model_type
+    return tank["modelo"]
+
+def warm_tanks(tank_ids=None, parallel=False):
+    """Train the models of the given tanks (all tanks if None) ahead of their first query.
+    With parallel=True the fits are spread over processes (see retrain_fleet).
+    Returns the list of tank ids that were trained by this call."""
+    pending = [tid for tid in (list(_tanks) if tank_ids is None else tank_ids)
+               if _tanks[tid]["modelo"] is None and _has_training_data(_tanks[tid])]
+    if parallel:
+        retrain_fleet(pending)
+        return pending
+    for tid in pending:
+        with _registry.tank_lock(tid):
+            _ensure_model(_tanks[tid])
+    return pending
+
+def _fit_worker(tank_id, diameter, length, heights, gallons, config):
+    """Process-pool entry point: fit one tank from float64 arrays and time it."""
+    t0 = time.perf_counter()
+    model, model_type = _train_model_from_data(heights, gallons, diameter=diameter, length=length, **config)
+    return tank_id, model, model_type, time.perf_counter() - t0
+
+def retrain_fleet(tank_ids=None, max_workers=None):
+    """Retrain many tanks (all if None) in parallel on a ProcessPoolExecutor.
+    Training data is sent to the workers as contiguous float64 arrays, disk-cache hits are
+    served in this process, and the fitted models are installed into _tanks together with
+    their strapping tables.
+    Returns {tank_id: seconds} with the fit time of each tank (cache hits: load time).
+    """
+    ids = list(_tanks) if tank_ids is None else list(tank_ids)
+    timings = {}
+    jobs = []
+    for tid in ids:
+        tank = _tanks[tid]
+        t0 = time.perf_counter()
+        key = _model_cache_key(tank)
+        cached = _load_cached_model(key)
+        if cached is not None:
+            _install_model(tid, *cached, _build_strapping_table(tank, model=cached[0]), cache_key=key)
+            timings[tid] = time.perf_counter() - t0
+        else:
+            jobs.append((tid, key))
+    if not jobs:
+        return timings
+    
+    # imported here: multiprocessing is only needed by fleet retrains
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {}
+        for tid, key in jobs:
+            tank = _tanks[tid]
+            fut = pool.submit(
+                _fit_worker, tid, tank["D"], tank["L"],
+                np.ascontiguousarray(tank["_training_heights"], dtype=np.float64),
+                np.ascontiguousarray(tank["_training_galones"], dtype=np.float64),
+                dict(tank["training_config"])
+            )
+            futures[fut] = key
+        for fut in futures:
+            tid, model, model_type, seconds = fut.result()
+            _store_cached_model(futures[fut], model, model_type)
+            _install_model(tid, model, model_type, _build_strapping_table(_tanks[tid], model=model),
+                           cache_key=futures[fut])
+            timings[tid] = seconds
+    return timings
+
+# --- entrenamiento en segundo plano ---
+class _TrainingExecutor:
+    """Runs tank retrains on worker threads and swaps the new model in when done.
+    A retrain requested while another one for the same tank is still queued is merged
+    into it (the queued job reads the tank's data when it starts), so bursts of
+    calibration points cost one fit. Queries keep using the previous model meanwhile.
+    """
+    def __init__(self, max_workers=2):
+        self._max_workers = max_workers
+        self._pool = None
+        self._lock = threading.Lock()
+        self._queued = {}     # tank_id -> Future of a retrain that has not started yet
+        self._seq = 0         # start order of retrains, i.e. how fresh their data is
+        self._installed = {}  # tank_id -> seq of the model currently installed
+
+    def submit(self, tank_id):
+        with self._lock:
+            fut = self._queued.get(tank_id)
+            if fut is not None:
+                return fut
+            fut = Future()
+            self._queued[tank_id] = fut
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self._max_workers,
+                                                thread_name_prefix="calculo-train")
+            self._pool.submit(self._run, tank_id, fut)
+            return fut
+
+    def _run(self, tank_id, fut):
+        with self._lock:
+            # from now on a new request for this tank queues a fresh retrain
+            self._queued.pop(tank_id, None)
+            self._seq += 1
+            seq = self._seq
+            tank = _tanks.get(tank_id)
+            snapshot = None
+            if tank is not None:
+                # the point views are never written again, so no copy is needed
+                heights, gallons = tank.points()
+                snapshot = {
+                    **tank,
+                    "_training_heights": heights,
+                    "_training_galones": gallons
+                }
+        if not fut.set_running_or_notify_cancel():
+            return
+        try:
+            if snapshot is None:
+                raise ValueError(f"Tank {tank_id} does not exist")
+            model, model_type, key = _fit_tank_model(snapshot)
+            # compiled here as well, so queries never rebuild the table under the tank lock
+            tabla = _build_strapping_table(snapshot, model=model)
+            # tank lock before executor lock, the order submitters use as well
+            with _registry.tank_lock(tank_id), self._lock:
+                # a retrain that started later (fresher data) may already have finished
+                if _tanks.get(tank_id) is tank and seq > self._installed.get(tank_id, 0):
+                    self._installed[tank_id] = seq
+                    _install_model(tank_id, model, model_type, tabla, cache_key=key)
+            fut.set_result((model, model_type))
+        except Exception as e:
+            fut.set_exception(e)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait)
+
+_training_executor = _TrainingExecutor()
+
+def _install_model(tank_id, model, model_type, tabla=None, cache_key=None):
+    """Swap a trained model into a tank (and the legacy globals if it is the current tank).
+    tabla is the model's strapping table if it was already compiled (see _build_strapping_table)
+    and cache_key the model's disk-cache key (see _model_cache_key)."""
+    global modelo, modelo_type
+    with _registry.tank_lock(tank_id):
+        tank = _tanks[tank_id]
+        _retire_cached_model(tank, cache_key)
+        tank["modelo_type"] = model_type
+        tank["modelo"] = model
+        tank["_tabla"] = tabla
+        if tank_id == _current_tank_id:
+            modelo = model
+            modelo_type = model_type
+
+def submit_retrain(tank_id=None):
+    """Retrain a tank's model in the background.
+    Returns a concurrent.futures.Future resolving to (model, model_type). Predictions keep
+    using the previous model until the new one is swapped in."""
+    _tank_id = tank_id if tank_id is not None else _current_tank_id
+    if _tank_id not in _tanks:
+        raise ValueError(f"Tank {_tank_id} does not exist")
+    return _training_executor.submit(_tank_id)
+
+def _predict_model(model, heights):
+    """Predict a flat float array for an array of heights.
+    All models accept a single-column 2-D input, so no model_type is needed here."""
+    x = np.asarray(heights, dtype=float).reshape(-1, 1)
+    return np.asarray(model.predict(x), dtype=float).reshape(-1)
+
+# --- tabla de aforo (strapping table) precalculada por tanque ---
+# Paso de la tabla en pulgadas (1/64"). Cada consulta cuesta un par de lecturas de array.
+STRAPPING_TABLE_STEP = 1.0 / 64.0
+
+def _build_strapping_table(tank, step=None, model=None):
+    """Compile the tank's model (or the analytic formula if untrained) into a table on an
+    evenly spaced height grid. The interpolation error against the live model is measured
+    at the midpoints between grid nodes, where linear interpolation is worst.
+    model compiles a freshly fitted model that is not installed in the tank yet."""
+    t0 = time.perf_counter()
+    _D = tank["D"]
+    n = int(np.ceil(_D / (step or STRAPPING_TABLE_STEP))) + 1
+    alturas = np.linspace(0.0, _D, n)
+    _modelo = _ensure_model(tank) if model is None else model
+    if _modelo is None:
+        galones_tab = galones_por_altura_array(alturas, diameter=_D, length=tank["L"])
+        medios = galones_por_altura_array(alturas[:-1] + 0.5 * np.diff(alturas), diameter=_D, length=tank["L"])
+    else:
+        galones_tab = _predict_model(_modelo, alturas)
+        medios = _predict_model(_modelo, alturas[:-1] + 0.5 * np.diff(alturas))
+    error = np.abs(0.5 * (galones_tab[:-1] + galones_tab[1:]) - medios)
+    # inverse (gallons -> height) over the table forced to be non-decreasing
+    gal_mono = np.maximum.accumulate(galones_tab)
+    return {
+        "D": _D,
+        "L": tank["L"],
+        "modelo": _modelo,
+        "step": _D / (n - 1),
+        "galones": galones_tab,
+        "inversa": (gal_mono, alturas),
+        "max_error": float(error.max()) if error.size else 0.0,
+        "mean_error": float(error.mean()) if error.size else 0.0,
+        "compile_seconds": time.perf_counter() - t0
+    }
+
+def _invalidate_strapping_table(tank):
+    tank["_tabla"] = None
+
+def _get_strapping_table(tank):
+    """Return the cached strapping table, rebuilding it if D, L or the model changed."""
+    tabla = tank.get("_tabla")
+    if (tabla is None or tabla["D"] != tank["D"] or tabla["L"] != tank["L"]
+            or tabla["modelo"] is not tank["modelo"]):
+        tabla = _build_strapping_table(tank)
+        tank["_tabla"] = tabla
+    return tabla
+
+def compile_model(tank_id=None, resolution=None):
+    """(Re)compile a tank's model into its strapping table and report the table's accuracy.
+    resolution is the grid step in inches (default STRAPPING_TABLE_STEP); it applies until
+    the table is next invalidated. Returns a dict with the step, number of points, max and
+    mean absolute error against the live model, and compile time.
+    """
+    tid = tank_id if tank_id is not None else _current_tank_id
+    with _registry.tank_lock(tid):
+        tank = _tanks[tid]
+        tabla = _build_strapping_table(tank, step=resolution)
+        tank["_tabla"] = tabla
+    return {
+        "tank_id": tid,
+        "step": tabla["step"],
+        "points": int(tabla["galones"].shape[0]),
+        "max_error": tabla["max_error"],
+        "mean_error": tabla["mean_error"],
+        "compile_seconds": tabla["compile_seconds"]
+    }
+
+# --- registro de tanques seguro entre hilos ---
+# Vista inmutable de un tanque: todos sus campos pertenecen al mismo estado del tanque.
+TankView = collections.namedtuple("TankView", "tank_id name D L R modelo modelo_type tabla")
+
+class TankRegistry:
+    """Thread-safe access to the tank records (_tanks) and the current tank.
+    Readers get immutable TankView snapshots; writers hold the registry or a tank lock."""
+    def __init__(self, tanks, current_id="default"):
+        self.tanks = tanks            # tank_id -> mutable record, changed by writers only
+        self.current_id = current_id
+        # structural changes (create, delete, load, current tank) take self.lock; changes
+        # to a tank's data or model take that tank's lock
+        self.lock = threading.RLock()
+        self._tank_locks = {}
+        # copy-on-write: a view is rebuilt under the tank lock only when the record's model
+        # or table object was replaced, so queries normally take no lock
+        self._views = {}              # tank_id -> (record, TankView)
+
+    def tank_lock(self, tank_id):
+        lock = self._tank_locks.get(tank_id)
+        if lock is None:
+            with self.lock:
+                lock = self._tank_locks.setdefault(tank_id, threading.RLock())
+        return lock
+
+    def _publish(self, tank_id, tank):
+        with self.tank_lock(tank_id):
+            view = TankView(tank_id, tank["name"], tank["D"], tank["L"], tank["R"],
+                            tank["modelo"], tank["modelo_type"], tank["_tabla"])
+            self._views[tank_id] = (tank, view)
+            return view
+
+    def view(self, tank_id=None):
+        """Latest view of a tank (the current tank if None; unknown ids use the default tank)."""
+        tid = self.current_id if tank_id is None else tank_id
+        tank = self.tanks.get(tid)
+        if tank is None:
+            tid, tank = "default", self.tanks["default"]
+        entry = self._views.get(tid)
+        if (entry is None or entry[0] is not tank or entry[1].modelo is not tank["modelo"]
+                or entry[1].tabla is not tank["_tabla"]):
+            return self._publish(tid, tank)
+        return entry[1]
+
+    def _refresh(self, view, prepare):
+        # first reader does the work under the tank lock; concurrent readers wait for it
+        with self.tank_lock(view.tank_id):
+            tank = self.tanks.get(view.tank_id)
+            if tank is None:
+                return view
+            prepare(tank)
+            return self._publish(view.tank_id, tank)
+
+    def trained_view(self, tank_id=None):
+        """View whose model has been trained (see _ensure_model)."""
+        view = self.view(tank_id)
+        if view.modelo is None:
+            view = self._refresh(view, _ensure_model)
+        return view
+
+    def compiled_view(self, tank_id=None):
+        """View with a strapping table compiled from its own model."""
+        view = self.view(tank_id)
+        if view.tabla is None or view.tabla["modelo"] is not view.modelo:
+            view = self._refresh(view, _get_strapping_table)
+        return view
+
+    def galones(self, h, tank_id=None):
+        tabla = self.compiled_view(tank_id).tabla
+        gal_tab = tabla["galones"]
+        pos = np.clip(np.asarray(h, dtype=float), 0.0, tabla["D"]) / tabla["step"]
+        i = np.minimum(pos.astype(np.intp), gal_tab.shape[0] - 2)
+        frac = pos - i
+        return gal_tab[i] + frac * (gal_tab[i + 1] - gal_tab[i])
+
+    def altura(self, g, tank_id=None):
+        gal_mono, alturas = self.compiled_view(tank_id).tabla["inversa"]
+        return np.interp(np.asarray(g, dtype=float), gal_mono, alturas)
+
+    def predict(self, heights, tank_id=None):
+        view = self.trained_view(tank_id)
+        h = np.clip(np.asarray(heights, dtype=float), 0.0, view.D)
+        return _predict_model(view.modelo, h).reshape(h.shape)
+
+    def items(self):
+        return list(self.tanks.items())
+
+    def add(self, tank_id, tank):
+        with self.lock:
+            self.tanks[tank_id] = tank
+
+    def replace(self, tanks):
+        """Swap in a whole new set of records (config load). Tanks present in both stay
+        reachable throughout."""
+        with self.lock:
+            self.tanks.update(tanks)
+            for tid in [t for t in self.tanks if t not in tanks]:
+                del self.tanks[tid]
+                self._views.pop(tid, None)
+
+    def remove(self, tank_id):
+        with self.lock:
+            del self.tanks[tank_id]
+            self._views.pop(tank_id, None)
+            if self.current_id == tank_id:
+                self.current_id = "default"
+
+    def set_current(self, tank_id):
+        with self.lock:
+            if tank_id not in self.tanks:
+                raise ValueError(f"Tank {tank_id} does not exist")
+            self.current_id = tank_id
+
+_registry = TankRegistry(_tanks)
+
+def get_tank_view(tank_id=None):
+    """Consistent, immutable TankView of a tank (current tank if None). Safe to call from
+    any thread; the model and table it holds stay valid while other threads retrain."""
+    return _registry.view(tank_id)
+
+def galones_tabla(h, tank_id=None):
+    """Gallons served from the tank's precomputed strapping table with linear interpolation.
+    h may be a scalar or an array. If tank_id is provided, uses that tank, otherwise uses current tank.
+    """
+    res = _registry.galones(h, tank_id)
+    if np.ndim(res) == 0:
+        return float(res)
+    return res
+
+def altura_por_galones_ml(g, tank_id=None):
+    """Inverse of galones_tabla: height for g gallons using the tank's calibrated model.
+    Inverts the strapping table after forcing it to be non-decreasing, so the result is
+    accurate to the table step (STRAPPING_TABLE_STEP). g may be a scalar or an array.
+    """
+    res = _registry.altura(g, tank_id)
+    if np.ndim(res) == 0:
+        return float(res)
+    return res
+
 def _initialize_tank_training(tank_id):
-    """Initialize training data for a tank"""
+    """Initialize training data for a tank: no measured points yet. The analytic samples
+    are not stored; they are generated at training time (training_config["prior_samples"])."""
     tank = _tanks[tank_id]
-    _D = tank["D"]
-    alturas = np.linspace(0, _D, 361).reshape(-1, 1)
-    galones = np.array([galones_por_altura(h[0], diameter=_D, length=tank["L"]) for h in alturas])
-    
-    tank["_training_heights"] = alturas.flatten().tolist()
-    tank["_training_galones"] = galones.flatten().tolist()
+    tank.clear_points()
     
-    # Train initial model
-    modelo, modelo_type = _train_model_from_data(tank["_training_heights"], tank["_training_galones"])
-    tank["modelo"] = modelo
-    tank["modelo_type"] = modelo_type
+    # Model is trained lazily on first use (see _ensure_model)
+    tank["modelo"] = None
+    _invalidate_strapping_table(tank)
 
 # Initialize default tank
 _initialize_tank_training("default")
 
 # Legacy global variables for backward compatibility
-alturas = np.array(_tanks["default"]["_training_heights"]).reshape(-1, 1)
-galones = np.array(_tanks["default"]["_training_galones"])
+alturas, galones = _analytic_prior(D, L, DEFAULT_TRAINING_CONFIG["prior_samples"])
+alturas = alturas.reshape(-1, 1)
 _training_heights = _tanks["default"]["_training_heights"]
 _training_galones = _tanks["default"]["_training_galones"]
 modelo = _tanks["default"]["modelo"]
 modelo_type = _tanks["default"]["modelo_type"]
 
-# Initially train model with analytic data
-# (Already done in _initialize_tank_training)
+# Note: `modelo` stays None until the current tank's model is first used (lazy training)
 
-def galones_ml(h, tank_id=None):
+def galones_ml(h, tank_id=None, use_table=True):
     """
     Predicción de galones usando el modelo entrenado.
     If tank_id is provided, uses that tank's model, otherwise uses current tank.
+    By default the answer comes from the compiled strapping table (see compile_model);
+    use_table=False queries the live model.
     """
-    tid = tank_id if tank_id is not None else _current_tank_id
-    tank = _tanks.get(tid, _tanks["default"])
-    _modelo = tank["modelo"]
-    _modelo_type = tank["modelo_type"]
-    _D = tank["D"]
-    
-    h = float(np.clip(h, 0.0, _D))  # limitar a rango válido
-    pred = _modelo.predict(np.array([[h]]) if _modelo_type == "sklearn_rf" else np.array([h]))
-    try:
-        return float(pred[0])
-    except Exception:
-        return float(pred)
+    if use_table:
+        return galones_tabla(h, tank_id)
+    return float(_registry.predict(float(h), tank_id))
 
-# Ejemplo
-if __name__ == "__main__":
-    print("Modelo listo. (sklearn disponible: {} )".format(SKLEARN_AVAILABLE))
-    while True:
-        entrada = input("Altura medida (pulgadas, q para salir): ")
-        if entrada.lower().startswith("q"):
-            break
-        try:
-            h = float(entrada)
-        except ValueError:
-            print("Entrada no válida. Introduce un número o 'q' para salir.")
-            continue
-        g = galones_ml(h)
-        print(f"Altura = {h:.3f} in  →  {g:.1f} galones (modelo ML)")
+def galones_ml_batch(heights, tank_id=None, use_table=True):
+    """
+    Predicción de galones para un array de alturas en una sola llamada al modelo.
+    Returns a float array with the same shape as heights.
+    By default served from the compiled strapping table; use_table=False queries the live model.
+    """
+    if use_table:
+        return np.asarray(galones_tabla(np.asarray(heights, dtype=float), tank_id), dtype=float)
+    return _registry.predict(heights, tank_id)
+
+def galones_fleet(tank_ids, heights, tanks=None, use_table=True):
+    """Gallons for parallel sequences of tank ids and heights, in input order.
+    tank_ids may instead hold integer positions into tanks, a sequence of ids.
+    use_table=False predicts with the live models. The current tank is not used."""
+    h = np.asarray(heights, dtype=float)
+    forma = h.shape
+    h = h.reshape(-1)
+    if tanks is None:
+        indice = {}
+        ids = tank_ids.tolist() if isinstance(tank_ids, np.ndarray) else tank_ids
+        codes = np.fromiter((indice.setdefault(t, len(indice)) for t in ids), dtype=np.intp)
+        tanks = list(indice)
+    else:
+        # positions skip hashing the ids: the fastest form for repeated reporting cycles
+        tanks = list(tanks)
+        codes = np.asarray(tank_ids, dtype=np.intp).reshape(-1)
+    if codes.shape != h.shape:
+        raise ValueError(f"tank_ids ({codes.size}) and heights ({h.size}) have different lengths")
+    if codes.size and (codes.min() < 0 or codes.max() >= len(tanks)):
+        raise ValueError("tank_ids positions out of range for tanks")
+    desconocidos = [t for t in tanks if t not in _tanks]
+    if desconocidos:
+        raise ValueError(f"Unknown tanks: {desconocidos}")
+    if not h.size:
+        return np.empty(forma)
+    
+    if use_table:
+        # the tables of the tanks involved are concatenated and every pair is
+        # interpolated in one vectorized pass
+        tablas = [_registry.compiled_view(t).tabla for t in tanks]
+        tamanos = np.array([t["galones"].shape[0] for t in tablas], dtype=np.intp)
+        inicios = np.concatenate([[0], np.cumsum(tamanos)[:-1]]).astype(np.intp)
+        gal_tab = np.concatenate([t["galones"] for t in tablas])
+        diametros = np.array([t["D"] for t in tablas])[codes]
+        pasos = np.array([t["step"] for t in tablas])[codes]
+        
+        pos = np.clip(h, 0.0, diametros) / pasos
+        i = np.minimum(pos.astype(np.intp), tamanos[codes] - 2)
+        frac = pos - i
+        j = inicios[codes] + i
+        return (gal_tab[j] + frac * (gal_tab[j + 1] - gal_tab[j])).reshape(forma)
+    
+    # pairs grouped by tank (stable argsort), one live-model predict per tank
+    res = np.empty(h.shape[0])
+    orden = np.argsort(codes, kind="stable")
+    limites = np.searchsorted(codes[orden], np.arange(len(tanks) + 1))
+    for k, tid in enumerate(tanks):
+        idx = orden[limites[k]:limites[k + 1]]
+        if idx.size:
+            view = _registry.trained_view(tid)
+            res[idx] = _predict_model(view.modelo, np.clip(h[idx], 0.0, view.D))
+    return res.reshape(forma)
 
 # ----------------------------
 # Dataset, CSV I/O and calibration helper functions
@@ -157,26 +1009,31 @@ import csv
 import os
 
 # Multi-tank management functions
-def create_tank(name, diameter, length, tank_id=None):
-    """Create a new tank with given dimensions and initialize its training data"""
-    if tank_id is None:
-        tank_id = f"tank_{len(_tanks)}"
-    
-    _tanks[tank_id] = {
-        "D": float(diameter),
-        "L": float(length),
-        "R": float(diameter) / 2.0,
-        "name": name,
-        "_training_heights": [],
-        "_training_galones": [],
-        "modelo": None,
-        "modelo_type": None
-    }
-    
-    _initialize_tank_training(tank_id)
+def _new_tank_record(name, diameter, length, training_config=None):
+    return Tank(name, diameter, length, training_config)
+
+def create_tank(name, diameter, length, tank_id=None, training_config=None):
+    """Create a new tank with given dimensions and initialize its training data.
+    training_config optionally overrides entries of DEFAULT_TRAINING_CONFIG."""
+    training_config = dict(training_config or {})
+    _validate_training_config(training_config)
+    initialize()
     
-    # Auto-save tanks config
-    save_tanks_config()
+    with _registry.lock, _journal_lock:
+        if tank_id is None:
+            tank_id = f"tank_{len(_tanks)}"
+        _registry.add(tank_id, _new_tank_record(name, diameter, length, training_config))
+        _initialize_tank_training(tank_id)
+        
+        # Auto-save tanks config
+        _journal_append({
+            "op": "create_tank",
+            "tank_id": tank_id,
+            "name": name,
+            "D": float(diameter),
+            "L": float(length),
+            "training_config": training_config
+        })
     
     return tank_id
 
@@ -187,70 +1044,574 @@ def get_tank_list():
         "name": tank["name"],
         "diameter": tank["D"],
         "length": tank["L"],
-        "points": len(tank["_training_heights"])
-    } for tid, tank in _tanks.items()]
+        "points": tank.n_points
+    } for tid, tank in _registry.items()]
 
 def set_current_tank(tank_id):
     """Switch to a different tank"""
     global _current_tank_id, _training_heights, _training_galones, modelo, modelo_type, D, R, L
-    if tank_id not in _tanks:
-        raise ValueError(f"Tank {tank_id} does not exist")
-    
-    _current_tank_id = tank_id
-    tank = _tanks[tank_id]
-    
-    # Update global variables for backward compatibility
-    _training_heights = tank["_training_heights"]
-    _training_galones = tank["_training_galones"]
-    modelo = tank["modelo"]
-    modelo_type = tank["modelo_type"]
-    D = tank["D"]
-    R = tank["R"]
-    L = tank["L"]
+    with _registry.lock:
+        _registry.set_current(tank_id)
+        _current_tank_id = tank_id
+        tank = _tanks[tank_id]
+        
+        # Update global variables for backward compatibility. They are mirrors for old
+        # callers and are not updated atomically; threads should use get_tank_view().
+        _training_heights = tank["_training_heights"]
+        _training_galones = tank["_training_galones"]
+        modelo = tank["modelo"]
+        modelo_type = tank["modelo_type"]
+        D = tank["D"]
+        R = tank["R"]
+        L = tank["L"]
 
 def get_current_tank():
     """Get current tank info"""
+    tid = _registry.current_id
     return {
-        "id": _current_tank_id,
-        **_tanks[_current_tank_id]
+        "id": tid,
+        **_tanks[tid]
     }
 
 def delete_tank(tank_id):
     """Delete a tank (cannot delete default)"""
     if tank_id == "default":
         raise ValueError("Cannot delete default tank")
-    if tank_id not in _tanks:
-        raise ValueError(f"Tank {tank_id} does not exist")
-    
-    del _tanks[tank_id]
-    
-    # If we deleted current tank, switch to default
-    if _current_tank_id == tank_id:
-        set_current_tank("default")
-    
-    # Auto-save after deletion
-    save_tanks_config()
+    initialize()
+    with _registry.lock, _journal_lock:
+        if tank_id not in _tanks:
+            raise ValueError(f"Tank {tank_id} does not exist")
+        
+        _registry.remove(tank_id)
+        
+        # If we deleted current tank, switch to default
+        if _current_tank_id == tank_id:
+            set_current_tank("default")
+        
+        # Auto-save after deletion
+        _journal_append({"op": "delete_tank", "tank_id": tank_id})
+
+# --- persistencia: snapshot JSON + diario (journal) de cambios ---
+# Las mutaciones se registran como una línea JSON en <config>.journal; al cargar se aplica
+# el snapshot y luego el diario. Cuando el diario supera JOURNAL_MAX_BYTES se compacta en
+# un snapshot nuevo. Las escrituras las hace un hilo en segundo plano: los registros se
+# agrupan hasta SAVE_DELAY_SECONDS sin cambios o SAVE_MAX_PENDING registros; flush() las fuerza.
+JOURNAL_MAX_BYTES = 1024 * 1024
+# appends of more points than this are journaled as a .npy file in <config>_journal/
+JOURNAL_INLINE_MAX_POINTS = 10000
+SAVE_DELAY_SECONDS = 2.0
+SAVE_MAX_PENDING = 100
+_config_path = "tanks_config.json"
+# Formato del snapshot activo: "json" (todo en un archivo), "npy" (cabecera JSON pequeña y
+# arrays float64 por tanque en <config>_data/<tank_id>.<generación>.npy, columnas
+# [alturas; galones]; la cabecera nombra la generación vigente) o
+# "sharded" (índice con ids, nombres y tanque actual; un shard <tank_id>.json + .npy por
+# tanque en <config>_shards/, que se lee solo cuando se usa el tanque y se reescribe solo
+# cuando cambia; este formato no usa diario).
+STORAGE_FORMATS = ("json", "npy", "sharded")
+_config_storage = "json"
+
+def _journal_path(filepath):
+    return os.path.splitext(filepath)[0] + ".journal"
+
+def _journal_blob_dir(filepath):
+    # same directory for the config path and for its journal path
+    return os.path.splitext(filepath)[0] + "_journal"
+
+def _write_journal_records(path, records):
+    """Append records to a journal in one write. Returns the journal size afterwards."""
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write("".join(json.dumps(record) + "\n" for record in records))
+        return f.tell()
+
+class _SaveScheduler:
+    """Coalesces config writes and performs them on a background thread."""
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        # pending: at most one snapshot, then journal records. A new snapshot supersedes
+        # the records queued before it; it is built by the mutating thread, written here.
+        self._snapshot = None
+        self._records = []
+        self._shards = {}     # tank_id -> config path whose shard must be rewritten
+        self._index = None    # config path whose shard index must be rewritten
+        self._deadline = None
+        self._thread = None
+        self.compact_requested = False
+        self.index_current = None
+
+    def add_record(self, path, record):
+        with self._cond:
+            self._records.append((path, record))
+            if len(self._records) >= SAVE_MAX_PENDING:
+                self._deadline = time.monotonic()
+            else:
+                self._deadline = time.monotonic() + SAVE_DELAY_SECONDS
+            self._start()
+            self._cond.notify()
+
+    def add_shard(self, path, tank_id, index=False):
+        with self._cond:
+            if tank_id is not None:
+                self._shards[tank_id] = path
+            if index:
+                self._index = path
+            self._deadline = time.monotonic() + SAVE_DELAY_SECONDS
+            self._start()
+            self._cond.notify()
+
+    def add_snapshot(self, snapshot):
+        with self._cond:
+            self._snapshot = snapshot
+            self._records = []
+            self._shards = {}
+            self._index = None
+            self.compact_requested = False
+            self._deadline = time.monotonic() + SAVE_DELAY_SECONDS
+            self._start()
+            self._cond.notify()
+
+    def _start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name="calculo-save", daemon=True)
+            self._thread.start()
 
-def save_tanks_config(filepath="tanks_config.json"):
-    """Save all tanks configuration to JSON file"""
+    def _loop(self):
+        while True:
+            with self._cond:
+                while self._deadline is None or time.monotonic() < self._deadline:
+                    self._cond.wait(None if self._deadline is None else self._deadline - time.monotonic())
+            try:
+                self.drain()
+            except Exception as e:
+                print(f"Error saving tanks config: {e}")
+
+    def drain(self):
+        """Write everything pending now, in order, on the calling thread."""
+        with self._write_lock:
+            with self._cond:
+                snapshot, records = self._snapshot, self._records
+                shards, index = self._shards, self._index
+                self._snapshot, self._records, self._deadline = None, [], None
+                self._shards, self._index = {}, None
+            if snapshot is not None:
+                _write_snapshot(snapshot)
+            # shards are captured here, from the current state of each tank
+            for tank_id, path in shards.items():
+                tank = _tanks.get(tank_id)
+                if tank is None:
+                    _remove_shard(_shard_dir(path), tank_id)
+                else:
+                    _write_shard(_shard_dir(path), tank_id, tank)
+            if index is not None:
+                self.index_current = _current_tank_id
+                _write_text_atomic(index, _shard_index_text(index))
+            by_path = {}
+            for path, record in records:
+                by_path.setdefault(path, []).append(record)
+            for path, recs in by_path.items():
+                if _write_journal_records(path, recs) > JOURNAL_MAX_BYTES:
+                    self.compact_requested = True
+
+_save_scheduler = _SaveScheduler()
+
+# Cada snapshot lleva un id único (snapshot_id) y cada registro del diario el id del snapshot
+# sobre el que se hizo; al cargar solo se aplican los registros de ese snapshot. Al escribir
+# un snapshot sobre un archivo se borran su diario y sidecars anteriores. Los registros se
+# numeran (seq) dentro de cada snapshot. Mutación y registro se hacen bajo _journal_lock,
+# que también toma _build_snapshot.
+_journal_lock = threading.RLock()
+_snapshot_id = None   # snapshot of the active config file (None: file without id, or none yet)
+_journal_seq = 0
+
+def _journal_blob_name(snapshot_id, seq):
+    # sidecars are named after their record: <snapshot_id>.<seq>.npy
+    return f"{snapshot_id or 'base'}.{seq}"
+
+def _journal_append(record):
+    """Queue one mutation record for the journal of the active config file.
+    Call it holding _journal_lock, together with the mutation it records.
+    With sharded storage only the affected shard (and the index if needed) is rewritten."""
+    global _journal_seq
+    if _config_storage == "sharded":
+        index = (record["op"] in ("create_tank", "delete_tank")
+                 or _save_scheduler.index_current != _current_tank_id)
+        _save_scheduler.add_shard(_config_path, record.get("tank_id"), index=index)
+        return
+    _journal_seq += 1
+    if record["op"] == "append_points" and isinstance(record["h"], np.ndarray):
+        if record["h"].size > JOURNAL_INLINE_MAX_POINTS:
+            # bulk imports: the arrays go to a sidecar named after the record, written now
+            blob_dir = _journal_blob_dir(_config_path)
+            os.makedirs(blob_dir, exist_ok=True)
+            nombre = _journal_blob_name(_snapshot_id, _journal_seq)
+            _save_tank_arrays(blob_dir, nombre, np.vstack([record["h"], record["g"]]))
+            record = {"op": "append_points", "tank_id": record["tank_id"], "file": nombre + ".npy"}
+        else:
+            record = {**record, "h": record["h"].tolist(), "g": record["g"].tolist()}
+    record = {**record, "snapshot": _snapshot_id, "seq": _journal_seq, "current_tank_id": _current_tank_id}
+    _save_scheduler.add_record(_journal_path(_config_path), record)
+    if _save_scheduler.compact_requested:
+        _save_scheduler.add_snapshot(_build_snapshot(_config_path, _config_storage))
+
+def flush():
+    """Write all pending config changes to disk now. Call before shutdown."""
+    _save_scheduler.drain()
+
+atexit.register(flush)
+
+def compact_tanks_config():
+    """Fold the journal into a fresh snapshot of the active config file."""
+    save_tanks_config(_config_path)
+
+def _apply_journal_record(record, tanks, blob_dir=None):
+    """Replay one journal record onto the tanks dict being loaded (models stay untrained
+    until first use). blob_dir is where the record's .npy sidecar, if any, lives."""
+    op = record["op"]
+    tank_id = record.get("tank_id")
+    if op not in ("create_tank", "delete_tank") and tank_id not in tanks:
+        print(f"Ignoring journal record {op} for unknown tank {tank_id}")
+        return
+    if op == "create_tank":
+        tanks[tank_id] = _new_tank_record(record["name"], record["D"], record["L"], record["training_config"])
+    elif op == "delete_tank":
+        tanks.pop(tank_id, None)
+    elif op == "append_points":
+        tank = tanks[tank_id]
+        if "file" in record:
+            h, g = np.load(os.path.join(blob_dir, record["file"]))
+        else:
+            h, g = record["h"], record["g"]
+        tank.append_points(h, g)
+        tank["modelo"] = None
+        _invalidate_strapping_table(tank)
+    elif op == "clear_points":
+        tank = tanks[tank_id]
+        tank.clear_points()
+        tank["modelo"] = None
+        _invalidate_strapping_table(tank)
+    elif op == "set_training_config":
+        tank = tanks[tank_id]
+        tank["training_config"] = {**tank["training_config"], **record["config"]}
+        tank["modelo"] = None
+        _invalidate_strapping_table(tank)
+    else:
+        raise ValueError(f"Unknown journal operation: {op}")
+
+def _replay_journal(path, tanks, snapshot_id=None):
+    """Apply to tanks the complete records of a journal file that were made on the snapshot
+    snapshot_id. Returns (last recorded current tank id, last seq seen)."""
+    current_id = None
+    last_seq = 0
+    if not os.path.exists(path):
+        return current_id, last_seq
+    with open(path, 'r', encoding='utf-8') as f:
+        for lineno, line in enumerate(f, 1):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # a record cut short by a crash: everything before it is valid
+                print(f"Ignoring incomplete journal record at {path}:{lineno}")
+                break
+            # records of older versions have no snapshot id, like their snapshots
+            if record.get("snapshot") != snapshot_id:
+                continue
+            last_seq = max(last_seq, record.get("seq", 0))
+            _apply_journal_record(record, tanks, _journal_blob_dir(path))
+            current_id = record.get("current_tank_id", current_id)
+    return current_id, last_seq
+
+def _data_dir(filepath):
+    return os.path.splitext(filepath)[0] + "_data"
+
+# Versiones anteriores guardaban junto a los puntos medidos las 361 muestras analíticas
+# de linspace(0, D, 361); al cargar un archivo sin "measured_only" se eliminan. También las
+# copias reimportadas desde CSV con 4 decimales (diferencia < 5e-5 gal con la fórmula).
+_LEGACY_PRIOR_SAMPLES = 361
+
+def _strip_analytic_samples(diameter, length, heights, gallons):
+    """Drop the points that exactly match the legacy analytic samples of a tank.
+    Returns float64 arrays (heights, gallons) with the measured points only."""
+    h = np.asarray(heights, dtype=np.float64)
+    g = np.asarray(gallons, dtype=np.float64)
+    if h.size == 0:
+        return h, g
+    rejilla = np.linspace(0.0, diameter, _LEGACY_PRIOR_SAMPLES)
+    idx = np.clip(np.rint(h / diameter * (_LEGACY_PRIOR_SAMPLES - 1)), 0, _LEGACY_PRIOR_SAMPLES - 1).astype(int)
+    sinteticos = (np.isclose(h, rejilla[idx], rtol=1e-12, atol=1e-12)
+                  & np.isclose(g, galones_por_altura_array(rejilla[idx], diameter=diameter, length=length),
+                               rtol=0.0, atol=5e-5))
+    return h[~sinteticos], g[~sinteticos]
+
+def _tank_arrays(tank):
+    """A tank's dataset as one (2, n) float64 array: [heights; gallons]."""
+    return np.vstack(tank.points()).astype(np.float64, copy=False)
+
+def _tank_arrays_name(tank_id, generation=None):
+    # npy snapshots name their arrays <tank_id>.<generation>.npy; shards use <tank_id>.npy
+    return tank_id + ("" if generation is None else f".{generation}") + ".npy"
+
+def _save_tank_arrays(data_dir, tank_id, datos, generation=None):
+    """Write a tank's (2, n) dataset as a .npy file. Goes through a temp file and
+    os.replace so arrays currently memory-mapped from the old file stay valid."""
+    path = os.path.join(data_dir, _tank_arrays_name(tank_id, generation))
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as fh:
+        np.save(fh, datos)
+    os.replace(tmp_path, path)
+
+def _write_text_atomic(filepath, text):
+    tmp_path = filepath + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, filepath)
+
+def _load_tank_arrays(data_dir, tank_id, generation=None):
+    """Memory-map a tank's dataset (zero-copy). Returns the read-only (2, n) array."""
+    return np.load(os.path.join(data_dir, _tank_arrays_name(tank_id, generation)), mmap_mode='r')
+
+def _next_data_generation(data_dir):
+    """One more than the newest array generation found in an npy data directory."""
+    generations = [0]
+    for fname in os.listdir(data_dir):
+        stem, _, generation = fname[:-4].rpartition(".")
+        if fname.endswith(".npy") and stem and generation.isdigit():
+            generations.append(int(generation))
+    return max(generations) + 1
+
+def _shard_dir(filepath):
+    return os.path.splitext(filepath)[0] + "_shards"
+
+class _ShardedTank(Tank):
+    """Tank record loaded from a shard index. The dataset and training config stay in the
+    tank's shard file until one of them is first accessed."""
+    __slots__ = ("shard_dir", "tank_id", "loaded")
+
+    def __init__(self, shard_dir, tank_id, name, diameter, length):
+        self.shard_dir = shard_dir
+        self.tank_id = tank_id
+        self.loaded = False
+        self.name = name
+        self.D = float(diameter)
+        self.L = float(length)
+        self.R = self.D / 2.0
+        self.modelo = None
+        self.cache_key = None
+        self._tabla = None
+
+    def __getattr__(self, attr):
+        # only reached for the slots left unset until the shard is read
+        if self.loaded or attr not in ("_puntos", "training_config", "modelo_type",
+                                       "_training_heights", "_training_galones"):
+            raise AttributeError(attr)
+        datos, self.modelo_type, self.training_config = _read_shard(self.shard_dir, self.tank_id)
+        self.set_points(datos)
+        self.loaded = True
+        return getattr(self, attr)
+
+    @property
+    def n_points(self):
+        if self.loaded:
+            return self._puntos[1]
+        return _shard_points(self.shard_dir, self.tank_id)
+
+def _shard_meta(tank):
+    return {
+        "measured_only": True,
+        "name": tank["name"],
+        "D": tank["D"],
+        "L": tank["L"],
+        "R": tank["R"],
+        "modelo_type": tank["modelo_type"],
+        "training_config": tank["training_config"]
+    }
+
+def _write_shard(shard_dir, tank_id, tank, datos=None, meta=None):
+    os.makedirs(shard_dir, exist_ok=True)
+    _save_tank_arrays(shard_dir, tank_id, _tank_arrays(tank) if datos is None else datos)
+    _write_text_atomic(os.path.join(shard_dir, tank_id + ".json"),
+                       json.dumps(_shard_meta(tank) if meta is None else meta, indent=2))
+
+def _remove_shard(shard_dir, tank_id):
+    for ext in (".json", ".npy"):
+        path = os.path.join(shard_dir, tank_id + ext)
+        if os.path.exists(path):
+            os.remove(path)
+
+def _read_shard(shard_dir, tank_id):
+    with open(os.path.join(shard_dir, tank_id + ".json"), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    datos = _load_tank_arrays(shard_dir, tank_id)
+    if not meta.get("measured_only"):
+        datos = np.vstack(_strip_analytic_samples(meta["D"], meta["L"], datos[0], datos[1]))
+    return (
+        datos,
+        meta.get("modelo_type", "interp"),
+        {
+            **DEFAULT_TRAINING_CONFIG,
+            **{k: v for k, v in meta.get("training_config", {}).items() if k in DEFAULT_TRAINING_CONFIG}
+        }
+    )
+
+def _shard_points(shard_dir, tank_id):
+    """Number of points in a shard, read from the .npy header only."""
+    return np.load(os.path.join(shard_dir, tank_id + ".npy"), mmap_mode='r').shape[1]
+
+def _shard_index_text(filepath):
+    return json.dumps({
+        "storage": "sharded",
+        "shard_dir": os.path.basename(_shard_dir(filepath)),
+        "current_tank_id": _current_tank_id,
+        "tanks": {tid: {"name": t["name"], "D": t["D"], "L": t["L"]} for tid, t in list(_tanks.items())}
+    }, indent=2)
+
+def _build_snapshot(filepath, storage):
+    """Capture the in-memory tanks as a snapshot ready to be written by _write_snapshot."""
+    with _journal_lock:
+        return _capture_snapshot(filepath, storage)
+
+def _capture_snapshot(filepath, storage):
+    global _snapshot_id, _journal_seq
+    activo = os.path.abspath(filepath) == os.path.abspath(_config_path)
+    snapshot_id = os.urandom(8).hex()
+    if activo:
+        # records made from now on belong to this snapshot
+        _snapshot_id, _journal_seq = snapshot_id, 0
     config = {
         "current_tank_id": _current_tank_id,
+        "measured_only": True,
+        "snapshot_id": snapshot_id,
         "tanks": {}
     }
+    arrays = {}
+    metas = {}
+    if storage == "npy":
+        config["storage"] = "npy"
+        config["data_dir"] = os.path.basename(_data_dir(filepath))
+    elif storage == "sharded":
+        config["storage"] = "sharded"
+        config["shard_dir"] = os.path.basename(_shard_dir(filepath))
     
-    for tank_id, tank_data in _tanks.items():
+    for tank_id, tank_data in list(_tanks.items()):
+        if storage == "sharded":
+            config["tanks"][tank_id] = {"name": tank_data["name"], "D": tank_data["D"], "L": tank_data["L"]}
+            # a shard that was never loaded is already on disk unchanged
+            if not (isinstance(tank_data, _ShardedTank) and not tank_data.loaded
+                    and os.path.abspath(tank_data.shard_dir) == os.path.abspath(_shard_dir(filepath))):
+                arrays[tank_id] = _tank_arrays(tank_data)
+                metas[tank_id] = _shard_meta(tank_data)
+            continue
         config["tanks"][tank_id] = {
             "name": tank_data["name"],
             "D": tank_data["D"],
             "L": tank_data["L"],
             "R": tank_data["R"],
-            "_training_heights": tank_data["_training_heights"],
-            "_training_galones": tank_data["_training_galones"],
-            "modelo_type": tank_data["modelo_type"]
+            "modelo_type": tank_data["modelo_type"],
+            "training_config": tank_data["training_config"]
         }
+        datos = _tank_arrays(tank_data)
+        if storage == "npy":
+            arrays[tank_id] = datos
+            config["tanks"][tank_id]["points"] = datos.shape[1]
+        else:
+            config["tanks"][tank_id]["_training_heights"] = datos[0].tolist()
+            config["tanks"][tank_id]["_training_galones"] = datos[1].tolist()
+    
+    return {
+        "filepath": filepath,
+        "storage": storage,
+        "text": json.dumps(config, indent=2),
+        "arrays": arrays,
+        "metas": metas,
+        "snapshot_id": snapshot_id
+    }
+
+def _write_snapshot(snapshot):
+    """Write a snapshot atomically (temp file + os.replace) and remove the file's journal
+    and sidecars from earlier snapshots, whose records no longer apply to it."""
+    filepath = snapshot["filepath"]
+    text = snapshot["text"]
+    if snapshot["storage"] == "npy":
+        # the arrays go to new files of a fresh generation; the header switches to them
+        # when it is replaced, and only then are the previous generations deleted
+        data_dir = _data_dir(filepath)
+        os.makedirs(data_dir, exist_ok=True)
+        generation = _next_data_generation(data_dir)
+        for tank_id, datos in snapshot["arrays"].items():
+            _save_tank_arrays(data_dir, tank_id, datos, generation)
+        config = json.loads(text)
+        config["data_generation"] = generation
+        text = json.dumps(config, indent=2)
+    elif snapshot["storage"] == "sharded":
+        shard_dir = _shard_dir(filepath)
+        for tank_id, datos in snapshot["arrays"].items():
+            _write_shard(shard_dir, tank_id, None, datos=datos, meta=snapshot["metas"][tank_id])
+        # drop the shards of deleted tanks
+        tank_ids = json.loads(snapshot["text"])["tanks"]
+        for fname in os.listdir(shard_dir):
+            if fname.endswith((".json", ".npy")) and os.path.splitext(fname)[0] not in tank_ids:
+                os.remove(os.path.join(shard_dir, fname))
+    
+    _write_text_atomic(filepath, text)
+    
+    # a config converted to another format leaves no files of the previous one behind
+    for formato, directorio in (("npy", _data_dir(filepath)), ("sharded", _shard_dir(filepath))):
+        if snapshot["storage"] != formato and os.path.isdir(directorio):
+            shutil.rmtree(directorio, ignore_errors=True)
+    
+    if snapshot["storage"] == "npy":
+        vigentes = {_tank_arrays_name(tank_id, generation) for tank_id in snapshot["arrays"]}
+        for fname in os.listdir(data_dir):
+            if fname.endswith((".npy", ".tmp")) and fname not in vigentes:
+                os.remove(os.path.join(data_dir, fname))
     
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(config, f, indent=2)
+    # records made on this snapshot are only written after it, so all the journal holds
+    # is older; their sidecars go too, except those of records queued after this snapshot
+    journal = _journal_path(filepath)
+    if os.path.exists(journal):
+        os.remove(journal)
+    blob_dir = _journal_blob_dir(filepath)
+    if os.path.isdir(blob_dir):
+        for fname in os.listdir(blob_dir):
+            if not fname.startswith(snapshot["snapshot_id"] + "."):
+                os.remove(os.path.join(blob_dir, fname))
+
+def save_tanks_config(filepath="tanks_config.json", storage=None):
+    """Save all tanks configuration to JSON file.
+    storage is "json" (arrays inline), "npy" (metadata in the JSON header, arrays in
+    <config>_data/*.npy) or "sharded" (index file plus one shard per tank in
+    <config>_shards/); None keeps the active file's format, or "json" for other paths.
+    Saving over a config file also clears its journal: records of the previous snapshot no longer apply.
+    The file is replaced atomically; the call returns once it is on disk."""
+    global _config_storage
+    initialize()
+    es_activo = os.path.abspath(filepath) == os.path.abspath(_config_path)
+    if storage is None:
+        storage = _config_storage if es_activo else "json"
+    if storage not in STORAGE_FORMATS:
+        raise ValueError(f"Unknown storage format: {storage}")
+    
+    if es_activo:
+        # through the scheduler so it is ordered with the journal writes; queued under the
+        # journal lock so that no record made after the capture is queued before it
+        with _journal_lock:
+            snapshot = _build_snapshot(filepath, storage)
+            _config_storage = storage
+            if storage == "sharded":
+                _save_scheduler.index_current = _current_tank_id
+            _save_scheduler.add_snapshot(snapshot)
+        flush()
+    else:
+        _write_snapshot(_build_snapshot(filepath, storage))
+
+def migrate_tanks_config(filepath="tanks_config.json", storage="npy"):
+    """Convert a config file (and its journal) to another storage format in place.
+    The data directory of the previous format is removed."""
+    if not load_tanks_config(filepath):
+        raise FileNotFoundError(filepath)
+    save_tanks_config(filepath, storage=storage)
 
 def load_tanks_config(filepath="tanks_config.json"):
     """Load tanks configuration from JSON file"""
@@ -259,144 +1620,337 @@ def load_tanks_config(filepath="tanks_config.json"):
     if not os.path.exists(filepath):
         return False
 def load_tanks_config(filepath="tanks_config.json"):
-    """Load tanks configuration from JSON file"""
+    """Load tanks configuration from JSON file and replay its journal (<config>.journal).
+    The file becomes the active config that later mutations are journaled against.
+    Trained models are cached in a sidecar directory next to it (<config>_models/)."""
     global _tanks, _current_tank_id, _training_heights, _training_galones, modelo, modelo_type, D, R, L
+    global _model_cache_dir, _config_path, _config_storage, _journal_seq, _snapshot_id, _initialized
     
-    if not os.path.exists(filepath):
+    journal = _journal_path(filepath)
+    # pending writes belong to the previously active file
+    flush()
+    if not os.path.exists(filepath) and not os.path.exists(journal):
         return False
     
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            config = json.load(f)
-        
-        # Restore tanks
-        _tanks.clear()
-        for tank_id, tank_data in config["tanks"].items():
-            _tanks[tank_id] = {
-                "name": tank_data["name"],
-                "D": tank_data["D"],
-                "L": tank_data["L"],
-                "R": tank_data["R"],
-                "_training_heights": tank_data["_training_heights"],
-                "_training_galones": tank_data["_training_galones"],
-                "modelo": None,
-                "modelo_type": tank_data.get("modelo_type", "interp")
-            }
+    # readers keep their views; writers wait until the new tanks are in place
+    with _registry.lock, _journal_lock:
+        try:
+            # the tanks are built apart and only swapped in once the whole load succeeded
+            if os.path.exists(filepath):
+                with open(filepath, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+                tanks = {}
+            else:
+                # a journal without snapshot was recorded on top of the built-in default tank
+                config = {"tanks": {}}
+                base = _tanks["default"]
+                tanks = {"default": _new_tank_record(base["name"], base["D"], base["L"])}
+            storage = config.get("storage", "json")
+            data_dir = os.path.join(os.path.dirname(filepath), config.get("data_dir", ""))
+            
+            if storage == "sharded":
+                # only the index is read here; shards load on first use of each tank
+                shard_dir = os.path.join(os.path.dirname(filepath), config["shard_dir"])
+                for tank_id, tank_data in config["tanks"].items():
+                    tanks[tank_id] = _ShardedTank(shard_dir, tank_id, tank_data["name"],
+                                                  tank_data["D"], tank_data["L"])
             
-            # Retrain model for each tank
-            if len(tank_data["_training_heights"]) > 0:
-                model, model_type = _train_model_from_data(
-                    tank_data["_training_heights"],
-                    tank_data["_training_galones"]
-                )
-                _tanks[tank_id]["modelo"] = model
-                _tanks[tank_id]["modelo_type"] = model_type
+            else:
+                # Restore tanks
+                for tank_id, tank_data in config["tanks"].items():
+                    if storage == "npy":
+                        datos = _load_tank_arrays(data_dir, tank_id, config.get("data_generation"))
+                    else:
+                        datos = np.array([tank_data["_training_heights"], tank_data["_training_galones"]],
+                                         dtype=np.float64).reshape(2, -1)
+                    if not config.get("measured_only"):
+                        datos = np.vstack(_strip_analytic_samples(tank_data["D"], tank_data["L"], datos[0], datos[1]))
+                    tanks[tank_id] = Tank(
+                        tank_data["name"],
+                        tank_data["D"],
+                        tank_data["L"],
+                        {k: v for k, v in tank_data.get("training_config", {}).items() if k in DEFAULT_TRAINING_CONFIG},
+                        modelo_type=tank_data.get("modelo_type", "interp"),
+                        datos=datos
+                    )
+                    # Models are trained on first use (_ensure_model) or via warm_tanks()
+            
+            journal_current, journal_seq = _replay_journal(journal, tanks, config.get("snapshot_id"))
+            if "default" not in tanks:
+                raise ValueError("the config has no default tank")
+        except Exception as e:
+            print(f"Error loading tanks config: {e}")
+            return False
+        
+        _config_path = filepath
+        _model_cache_dir = os.path.splitext(filepath)[0] + "_models"
+        _config_storage = storage
+        _snapshot_id = config.get("snapshot_id")
+        _journal_seq = journal_seq
+        if storage == "sharded":
+            _save_scheduler.index_current = config.get("current_tank_id")
+        _registry.replace(tanks)
+        _initialized = True
         
         # Restore current tank
-        current_id = config.get("current_tank_id", "default")
+        current_id = journal_current or config.get("current_tank_id", "default")
         if current_id in _tanks:
             set_current_tank(current_id)
         else:
             set_current_tank("default")
         
         return True
-    except Exception as e:
-        print(f"Error loading tanks config: {e}")
-        return False
 
-# Try to load saved tanks configuration
-try:
-    load_tanks_config()
-except:
-    pass  # If no config file exists, continue with default
+_initialized = False
+_initialize_lock = threading.Lock()
 
-def load_csv_training(filepath, tank_id=None):
-    """Load training CSV with two columns (Pulgadas,Galones). Returns lists (h_list, g_list).
-    Accepts decimal separator dot. Ignores header and rows that cannot be parsed.
+def initialize(filepath="tanks_config.json", warm=False):
+    """Load the saved tanks configuration once per process; later calls do nothing.
+    Importing calculo has no side effects, so apps call this at startup (before that only
+    the built-in default tank exists). Functions that change or save tanks call it first,
+    so nothing is journaled against a config that was never loaded. An explicit
+    load_tanks_config counts as the initialization. warm=True also trains the current tank's model
+    and compiles its strapping table instead of leaving that to the first query.
+    Returns True if this call did the initialization.
+    """
+    global _initialized
+    with _initialize_lock:
+        if _initialized:
+            return False
+        _initialized = True
+        try:
+            load_tanks_config(filepath)
+        except Exception as e:
+            # without a usable config the app starts with the default tank
+            print(f"Could not load tanks config: {e}")
+        if warm:
+            _get_strapping_table(_tanks[_current_tank_id])
+        return True
+
+# Filas por bloque al leer CSV grandes (una llamada a np.loadtxt por bloque)
+CSV_CHUNK_ROWS = 100000
+
+def _parse_csv_lines(lines, first_line, rejected):
+    """Slow path for a chunk with bad rows: parse it line by line with csv.reader and
+    record the 1-based line numbers of the rows that cannot be used."""
+    h_vals = []
+    g_vals = []
+    for lineno, row in enumerate(csv.reader(lines), start=first_line):
+        if not row or not any(cell.strip() for cell in row):
+            continue
+        try:
+            h_val = float(row[0])
+            g_val = float(row[1])
+        except (ValueError, IndexError):
+            rejected.append(lineno)
+            continue
+        if not (np.isfinite(h_val) and np.isfinite(g_val)):
+            rejected.append(lineno)
+            continue
+        h_vals.append(h_val)
+        g_vals.append(g_val)
+    return np.array(h_vals, dtype=np.float64), np.array(g_vals, dtype=np.float64)
+
+def iter_csv_chunks(filepath, max_height, chunk_rows=None, rejected=None):
+    """Stream a two-column CSV (Pulgadas,Galones) as float64 array chunks (heights, gallons).
+    Each chunk of chunk_rows lines (default CSV_CHUNK_ROWS) is parsed with one np.loadtxt
+    call; only chunks containing bad rows fall back to line-by-line parsing. A non-numeric
+    first line is taken as the header. Heights are clamped to [0, max_height]. Rows that
+    cannot be parsed or hold non-finite values are skipped and their 1-based line numbers
+    appended to the rejected list, if one is given.
     """
     if not os.path.exists(filepath):
         raise FileNotFoundError(filepath)
-    
-    h_list = []
-    g_list = []
-    
-    # Get tank dimensions for clamping
-    _tank_id = tank_id if tank_id is not None else _current_tank_id
-    tank = _tanks[_tank_id]
-    max_height = tank["D"]
+    if rejected is None:
+        rejected = []
+    chunk_rows = chunk_rows or CSV_CHUNK_ROWS
     
     with open(filepath, 'r', newline='', encoding='utf-8') as fh:
-        reader = csv.reader(fh)
-        header_skipped = False
-        for row in reader:
-            if not row:
-                continue
-            if not header_skipped:
-                # assume first row is header if not numeric
-                try:
-                    float(row[0])
-                except Exception:
-                    header_skipped = True
-                    continue
+        first_line = 1
+        primera = fh.readline()
+        try:
+            float(next(csv.reader([primera]))[0])
+            lines = [primera]
+        except (ValueError, IndexError, StopIteration):
+            # header (or empty file)
+            lines = []
+            first_line = 2
+        lines.extend(itertools.islice(fh, chunk_rows - len(lines)))
+        while lines:
             try:
-                h_val = float(row[0])
-                g_val = float(row[1])
-            except Exception:
-                continue
-            # clamp height to valid range
-            if h_val < 0:
-                h_val = 0.0
-            if h_val > max_height:
-                h_val = max_height
-            h_list.append(h_val)
-            g_list.append(g_val)
-    return h_list, g_list
-
-def append_training_points(h_vals, g_vals, tank_id=None):
+                datos = np.loadtxt(lines, delimiter=",", usecols=(0, 1), ndmin=2,
+                                   dtype=np.float64, comments=None)
+                if not np.isfinite(datos).all():
+                    raise ValueError("non-finite values")
+                h, g = datos[:, 0], datos[:, 1]
+            except ValueError:
+                h, g = _parse_csv_lines(lines, first_line, rejected)
+            if h.size:
+                yield np.clip(h, 0.0, max_height), np.ascontiguousarray(g)
+            first_line += len(lines)
+            lines = list(itertools.islice(fh, chunk_rows))
+
+def read_csv_arrays(filepath, tank_id=None, chunk_rows=None, rejected=None):
+    """Read a whole training CSV through iter_csv_chunks, with heights clamped to the
+    tank's diameter. Returns float64 arrays (heights, gallons)."""
+    _tank_id = tank_id if tank_id is not None else _current_tank_id
+    chunks = list(iter_csv_chunks(filepath, _tanks[_tank_id]["D"], chunk_rows, rejected))
+    if not chunks:
+        return np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float64)
+    return (np.concatenate([c[0] for c in chunks]),
+            np.concatenate([c[1] for c in chunks]))
+
+def load_csv_training(filepath, tank_id=None):
+    """Load training CSV with two columns (Pulgadas,Galones). Returns lists (h_list, g_list).
+    Accepts decimal separator dot. Ignores header and rows that cannot be parsed.
+    Large files are better read with read_csv_arrays, which avoids the lists.
+    """
+    heights, gallons = read_csv_arrays(filepath, tank_id)
+    return heights.tolist(), gallons.tolist()
+
+def append_training_points(h_vals, g_vals, tank_id=None, background=False):
     """Append given lists of heights and gallons to the internal dataset and retrain the model.
     h_vals and g_vals are iterables (scalars allowed) – will coerce to lists.
+    Models supporting insert() are updated incrementally; untrained models stay lazy.
+    With background=True a full retrain is submitted to the training executor and a
+    Future is returned instead (see submit_retrain).
     Returns new model and metrics.
     """
     global _training_heights, _training_galones, modelo, modelo_type
     
+    initialize()
     _tank_id = tank_id if tank_id is not None else _current_tank_id
-    tank = _tanks[_tank_id]
     
     if np.isscalar(h_vals):
         h_vals = [float(h_vals)]
     if np.isscalar(g_vals):
         g_vals = [float(g_vals)]
     
+    nuevos_h = []
+    nuevos_g = []
     for h, g in zip(h_vals, g_vals):
-        tank["_training_heights"].append(float(h))
-        tank["_training_galones"].append(float(g))
+        nuevos_h.append(float(h))
+        nuevos_g.append(float(g))
     
-    # Retrain model for this tank
-    model, model_type = _train_model_from_data(
-        tank["_training_heights"],
-        tank["_training_galones"]
-    )
-    tank["modelo"] = model
-    tank["modelo_type"] = model_type
+    with _registry.tank_lock(_tank_id):
+        tank = _tanks[_tank_id]
+        with _journal_lock:
+            tank.append_points(nuevos_h, nuevos_g)
+            # Auto-save config
+            _journal_append({"op": "append_points", "tank_id": _tank_id, "h": nuevos_h, "g": nuevos_g})
+        
+        en_segundo_plano = False
+        if tank["modelo"] is None:
+            # Not trained yet: the new points are picked up when the model is first used
+            model, model_type = None, tank["modelo_type"]
+            _invalidate_strapping_table(tank)
+        elif hasattr(tank["modelo"], "insert"):
+            # Incremental update: only the new points are inserted into the model
+            model = tank["modelo"].insert(nuevos_h, nuevos_g)
+            model_type = tank["modelo_type"]
+            tank["modelo"] = model
+        elif background:
+            en_segundo_plano = True
+        else:
+            # Retrain model for this tank
+            model, model_type = _train_tank(tank)
+        
+        # Update globals if this is the current tank
+        if _tank_id == _current_tank_id:
+            _training_heights = tank["_training_heights"]
+            _training_galones = tank["_training_galones"]
+            if not en_segundo_plano:
+                modelo = model
+                modelo_type = model_type
     
-    # Update globals if this is the current tank
-    if _tank_id == _current_tank_id:
-        _training_heights = tank["_training_heights"]
-        _training_galones = tank["_training_galones"]
-        modelo = model
-        modelo_type = model_type
+    if en_segundo_plano:
+        # submitted outside the tank lock, which the executor takes to install the model
+        return submit_retrain(_tank_id)
+    return model, model_type
+
+def _validate_training_config(config):
+    for key, value in config.items():
+        if key not in DEFAULT_TRAINING_CONFIG:
+            raise ValueError(f"Unknown training option: {key}")
+        if key == "model_type" and value is not None and value not in MODEL_TYPES:
+            raise ValueError(f"Unknown model type: {value}")
+        if key in ("n_estimators", "min_samples_leaf") and (not isinstance(value, int) or value < 1):
+            raise ValueError(f"{key} must be a positive integer")
+        if key == "max_depth" and value is not None and (not isinstance(value, int) or value < 1):
+            raise ValueError("max_depth must be None or a positive integer")
+        if key == "n_jobs" and value is not None and (not isinstance(value, int) or value == 0):
+            raise ValueError("n_jobs must be None or a non-zero integer")
+        if key == "prior_samples" and (not isinstance(value, int) or value < 0 or value == 1):
+            raise ValueError("prior_samples must be 0 or an integer >= 2")
+
+def get_training_config(tank_id=None):
+    """Return a copy of a tank's training configuration."""
+    _tank_id = tank_id if tank_id is not None else _current_tank_id
+    return dict(_tanks[_tank_id]["training_config"])
+
+def set_training_config(tank_id=None, **config):
+    """Update a tank's training configuration and retrain its model.
+    Options are the keys of DEFAULT_TRAINING_CONFIG: model_type (see MODEL_TYPES, e.g.
+    "interp" for incremental calibration), n_estimators, max_depth, min_samples_leaf,
+    n_jobs and prior_samples. Returns the new configuration.
+    """
+    global modelo, modelo_type
     
-    # Auto-save config
-    save_tanks_config()
+    initialize()
+    _tank_id = tank_id if tank_id is not None else _current_tank_id
+    _validate_training_config(config)
     
-    return model, model_type
+    with _registry.tank_lock(_tank_id):
+        tank = _tanks[_tank_id]
+        with _journal_lock:
+            tank["training_config"] = {**tank["training_config"], **config}
+            _journal_append({"op": "set_training_config", "tank_id": _tank_id, "config": config})
+        
+        model, model_type = _train_tank(tank)
+        if _tank_id == _current_tank_id:
+            modelo = model
+            modelo_type = model_type
+    
+    return dict(tank["training_config"])
+
+def verify_incremental_model(tank_id=None):
+    """Rebuild the tank's model from scratch and return the max absolute prediction difference
+    against the incrementally updated model, evaluated at the measured and prior heights
+    (0.0 = identical).
+    """
+    _tank_id = tank_id if tank_id is not None else _current_tank_id
+    tank = _tanks[_tank_id]
+    
+    if _ensure_model(tank) is None:
+        return 0.0
+    prior_h, _ = _analytic_prior(tank["D"], tank["L"], tank["training_config"]["prior_samples"])
+    x = np.concatenate([prior_h, np.asarray(tank["_training_heights"], dtype=float)])
+    exacto, _ = _train_model_from_data(
+        tank["_training_heights"],
+        tank["_training_galones"],
+        diameter=tank["D"],
+        length=tank["L"],
+        **{**tank["training_config"], "model_type": tank["modelo_type"]}
+    )
+    diff = _predict_model(tank["modelo"], x) - _predict_model(exacto, x)
+    return float(np.max(np.abs(diff))) if diff.size else 0.0
 
-def _retrain_model(n_estimators=200):
+def _retrain_model(n_estimators=None):
     global modelo, modelo_type
-    modelo, modelo_type = _train_model_from_data(_training_heights, _training_galones, n_estimators=n_estimators)
+    tank = _tanks[_current_tank_id]
+    config = dict(tank["training_config"])
+    if n_estimators is not None:
+        config["n_estimators"] = n_estimators
+    modelo, modelo_type = _train_model_from_data(
+        _training_heights,
+        _training_galones,
+        diameter=tank["D"],
+        length=tank["L"],
+        **config
+    )
 
 def save_training_csv(filepath):
-    """Save the current training dataset to CSV with header Pulgadas,Galones"""
+    """Save the current tank's measured points to CSV with header Pulgadas,Galones"""
     with open(filepath, 'w', newline='', encoding='utf-8') as fh:
         writer = csv.writer(fh)
         writer.writerow(['Pulgadas', 'Galones'])
@@ -404,62 +1958,261 @@ def save_training_csv(filepath):
             writer.writerow([h, g])
 
 def get_training_dataset():
-    """Return numpy arrays (heights, gallons) for the current training dataset."""
+    """Return numpy arrays (heights, gallons) of the current tank's measured points
+    (the analytic prior is not part of the dataset)."""
     return np.array(_training_heights), np.array(_training_galones)
 
-def reset_training_to_analytic(n_samples=361):
-    """Reset the training dataset to only the analytic sample values (equally spaced)."""
+def reset_training_to_analytic(n_samples=361, tank_id=None):
+    """Discard a tank's measured points so that it trains on the analytic prior only,
+    generated with n_samples equally spaced heights."""
     global _training_heights, _training_galones
-    alturas = np.linspace(0, D, n_samples)
-    galones_vals = np.array([galones_por_altura(h) for h in alturas])
-    _training_heights = alturas.tolist()
-    _training_galones = galones_vals.tolist()
-    _retrain_model()
+    initialize()
+    _tank_id = tank_id if tank_id is not None else _current_tank_id
+    # an invalid size must not cost the tank its points
+    _validate_training_config({"prior_samples": n_samples})
+    
+    with _registry.tank_lock(_tank_id):
+        tank = _tanks[_tank_id]
+        with _journal_lock:
+            _initialize_tank_training(_tank_id)
+            _journal_append({"op": "clear_points", "tank_id": _tank_id})
+        if _tank_id == _current_tank_id:
+            _training_heights = tank["_training_heights"]
+            _training_galones = tank["_training_galones"]
+        # retrains and journals the new prior size
+        set_training_config(_tank_id, prior_samples=n_samples)
 
 
 def evaluate_model_on_dataset(model_obj, heights, gallons):
-    """Return MAE and RMSE of model predictions on provided dataset (iterables)."""
-    x = np.array(heights)
-    y = np.array(gallons)
-    preds = model_obj.predict(x.reshape(-1, 1) if modelo_type == 'sklearn_rf' else x.flatten())
-    preds = np.array(preds).flatten()
-    if preds.shape != y.shape:
-        preds = preds[:y.shape[0]]
+    """Return MAE and RMSE of model predictions on provided dataset (iterables).
+    Works for any model type; raises ValueError if heights and gallons differ in length."""
+    x = np.asarray(heights, dtype=float).reshape(-1)
+    y = np.asarray(gallons, dtype=float).reshape(-1)
+    if x.shape != y.shape:
+        raise ValueError(f"heights ({x.size}) and gallons ({y.size}) have different lengths")
+    preds = _predict_model(model_obj, x)
     mae = np.mean(np.abs(preds - y))
     rmse = np.sqrt(np.mean((preds - y)**2))
     return mae, rmse
 
-def load_and_merge_csv(filepath, tank_id=None):
-    """Load CSV and merge with existing training data for specified tank"""
-    global _training_heights, _training_galones, modelo, modelo_type
+# --- validación cruzada y selección de modelo ---
+def _cv_fold(x, y, train_idx, test_idx, config, diameter, length):
+    t0 = time.perf_counter()
+    model, model_type = _train_model_from_data(x[train_idx], y[train_idx],
+                                               diameter=diameter, length=length, **config)
+    t1 = time.perf_counter()
+    preds = _predict_model(model, x[test_idx])
+    t2 = time.perf_counter()
+    return model_type, preds - y[test_idx], t1 - t0, t2 - t1
+
+def cross_validate_models(heights, gallons, candidates, k=5, diameter=None, length=None,
+                          max_workers=None, seed=42):
+    """k-fold cross-validation of several training configurations on one dataset.
+    candidates is a list of training-config dicts (keys of DEFAULT_TRAINING_CONFIG, missing
+    keys take the defaults). All (candidate, fold) fits run in parallel on a thread pool.
+    Returns one dict per candidate with config, model_type, mae, rmse, max_error,
+    fit_seconds and predict_seconds (mean per fold) and predict_us (microseconds per point).
+    """
+    x = np.asarray(heights, dtype=float).reshape(-1)
+    y = np.asarray(gallons, dtype=float).reshape(-1)
+    if x.shape != y.shape:
+        raise ValueError(f"heights ({x.size}) and gallons ({y.size}) have different lengths")
+    if not 2 <= k <= x.size:
+        raise ValueError(f"k must be between 2 and the number of points ({x.size})")
+    configs = []
+    for cand in candidates:
+        _validate_training_config(cand)
+        configs.append({**DEFAULT_TRAINING_CONFIG, **cand})
     
+    folds = np.array_split(np.random.default_rng(seed).permutation(x.size), k)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        jobs = [[pool.submit(_cv_fold, x, y, np.concatenate(folds[:i] + folds[i + 1:]), folds[i],
+                             config, diameter, length) for i in range(k)]
+                for config in configs]
+        results = []
+        for config, fold_jobs in zip(configs, jobs):
+            fold_res = [job.result() for job in fold_jobs]
+            err = np.concatenate([r[1] for r in fold_res])
+            results.append({
+                "config": config,
+                "model_type": fold_res[0][0],
+                "mae": float(np.mean(np.abs(err))),
+                "rmse": float(np.sqrt(np.mean(err**2))),
+                "max_error": float(np.max(np.abs(err))),
+                "fit_seconds": float(np.mean([r[2] for r in fold_res])),
+                "predict_seconds": float(np.mean([r[3] for r in fold_res])),
+                "predict_us": 1e6 * sum(r[3] for r in fold_res) / err.size
+            })
+    return results
+
+def select_model(tank_id=None, candidates=None, k=5, accuracy_budget=None, apply=False, max_workers=None):
+    """Cross-validate candidate training configs (default: one per model type) on a tank's
+    measured points; pick the fastest within accuracy_budget (MAE, gallons), else the most
+    accurate. apply=True trains the selection. Returns (results, selected_config or None)."""
     _tank_id = tank_id if tank_id is not None else _current_tank_id
     tank = _tanks[_tank_id]
+    if candidates is None:
+        candidates = [{"model_type": mt} for mt in MODEL_TYPES if mt != "sklearn_rf" or SKLEARN_AVAILABLE]
+    candidates = [{**tank["training_config"], **cand} for cand in candidates]
     
-    h_list, g_list = load_csv_training(filepath, tank_id)
-    if not h_list:
-        return 0
+    # the analytic prior (prior_samples) joins the training folds only, never the test fold
+    results = cross_validate_models(tank["_training_heights"], tank["_training_galones"], candidates,
+                                    k=k, diameter=tank["D"], length=tank["L"], max_workers=max_workers)
+    if accuracy_budget is None:
+        pool = results
+        key = lambda r: r["mae"]
+    else:
+        pool = [r for r in results if r["mae"] <= accuracy_budget]
+        # fastest = fit + predict time
+        key = lambda r: r["fit_seconds"] + r["predict_seconds"]
+    selected = min(pool, key=key)["config"] if pool else None
     
-    for h, g in zip(h_list, g_list):
-        tank["_training_heights"].append(h)
-        tank["_training_galones"].append(g)
+    if apply and selected is not None:
+        set_training_config(_tank_id, **selected)
+    return results, selected
+
+def load_and_merge_csv(filepath, tank_id=None, background=False, rejected=None):
+    """Load CSV and merge with existing training data for specified tank.
+    The file is read in chunks as float64 arrays (see iter_csv_chunks); line numbers of
+    rejected rows are appended to the rejected list if one is given.
+    With background=True the retrain runs on the training executor (see submit_retrain)."""
+    global _training_heights, _training_galones, modelo, modelo_type
     
-    # Retrain model for this tank
-    model, model_type = _train_model_from_data(
-        tank["_training_heights"],
-        tank["_training_galones"]
-    )
-    tank["modelo"] = model
-    tank["modelo_type"] = model_type
+    initialize()
+    _tank_id = tank_id if tank_id is not None else _current_tank_id
     
-    # Update globals if this is the current tank
-    if _tank_id == _current_tank_id:
-        _training_heights = tank["_training_heights"]
-        _training_galones = tank["_training_galones"]
-        modelo = model
-        modelo_type = model_type
+    heights, gallons = read_csv_arrays(filepath, _tank_id, rejected=rejected)
+    if not heights.size:
+        return 0
+    
+    with _registry.tank_lock(_tank_id):
+        tank = _tanks[_tank_id]
+        with _journal_lock:
+            tank.append_points(heights, gallons)
+            # Auto-save config
+            # arrays, not lists: large imports are journaled as a .npy sidecar
+            _journal_append({"op": "append_points", "tank_id": _tank_id, "h": heights, "g": gallons})
+        if _tank_id == _current_tank_id:
+            _training_heights = tank["_training_heights"]
+            _training_galones = tank["_training_galones"]
     
-    # Auto-save config
-    save_tanks_config()
+    if background:
+        submit_retrain(_tank_id)
+        return int(heights.size)
     
-    return len(h_list)
+    with _registry.tank_lock(_tank_id):
+        # Retrain model for this tank
+        model, model_type = _train_tank(tank)
+        
+        # Update globals if this is the current tank
+        if _tank_id == _current_tank_id:
+            modelo = model
+            modelo_type = model_type
+    
+    return int(heights.size)
+
+# --- flujo de lecturas de sensores (timestamp, tank_id, altura) ---
+# Ventana de la tasa de consumo (segundos) y máximo de lecturas recordadas por tanque.
+CONSUMPTION_WINDOW_SECONDS = 3600.0
+STREAM_MAX_SAMPLES = 4096
+
+def _timestamp_seconds(ts):
+    if isinstance(ts, datetime):
+        # naive datetimes are UTC, as in replay_readings_csv
+        return (ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts).timestamp()
+    return float(ts)
+
+def _parse_reading_timestamp(text):
+    """Epoch seconds (float) or an ISO 8601 datetime; naive ones are taken as UTC."""
+    try:
+        return float(text)
+    except ValueError:
+        ts = datetime.fromisoformat(text.strip())
+        return ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts
+
+def stream_volumes(readings, window=None, batch_size=1):
+    """Yield one dict (timestamp, tank_id, height, gallons, delta, rate_gph) per time-ordered
+    (timestamp, tank_id, height) reading. rate_gph is gallons/hour drawn over the last window
+    seconds, None until the window spans time. Naive datetime timestamps are UTC."""
+    window = CONSUMPTION_WINDOW_SECONDS if window is None else window
+    # per tank at most STREAM_MAX_SAMPLES readings trimmed to the window: O(1) amortized
+    historial = {}  # tank_id -> deque of (seconds, gallons)
+    lecturas = iter(readings)
+    # batch_size > 1 computes a batch's volumes in one galones_fleet call (fast replays;
+    # a live feed would wait for a full batch)
+    while True:
+        lote = list(itertools.islice(lecturas, batch_size))
+        if not lote:
+            return
+        if batch_size == 1:
+            tid = lote[0][1]
+            if tid not in _tanks:
+                raise ValueError(f"Tank {tid} does not exist")
+            volumenes = [float(_registry.galones(lote[0][2], tid))]
+        else:
+            volumenes = galones_fleet([r[1] for r in lote], [r[2] for r in lote]).tolist()
+        
+        for (ts, tid, h), g in zip(lote, volumenes):
+            t = _timestamp_seconds(ts)
+            hist = historial.get(tid)
+            if hist is None:
+                hist = historial[tid] = collections.deque(maxlen=STREAM_MAX_SAMPLES)
+            delta = g - hist[-1][1] if hist else None
+            while hist and t - hist[0][0] > window:
+                hist.popleft()
+            hist.append((t, g))
+            t0, g0 = hist[0]
+            yield {
+                "timestamp": ts,
+                "tank_id": tid,
+                "height": h,
+                "gallons": g,
+                "delta": delta,
+                "rate_gph": (g0 - g) * 3600.0 / (t - t0) if t > t0 else None
+            }
+
+def replay_readings_csv(filepath, rejected=None):
+    """Stream (timestamp, tank_id, height) readings from a CSV with those three columns,
+    for feeding stream_volumes. The file is read lazily, so its size does not matter.
+    Timestamps are epoch seconds or ISO 8601 text (UTC unless it has an offset); a first
+    line whose timestamp does not parse is taken as the header. Other rows that cannot be
+    parsed are skipped and their line numbers appended to the rejected list, if one is given.
+    """
+    if not os.path.exists(filepath):
+        raise FileNotFoundError(filepath)
+    with open(filepath, 'r', newline='', encoding='utf-8') as fh:
+        primera = True
+        for lineno, row in enumerate(csv.reader(fh), start=1):
+            if not row:
+                continue
+            if primera:
+                primera = False
+                # header detection as in iter_csv_chunks: only the first cell decides
+                try:
+                    _parse_reading_timestamp(row[0])
+                except ValueError:
+                    continue
+            try:
+                ts = _parse_reading_timestamp(row[0])
+                h = float(row[2])
+            except (ValueError, IndexError):
+                if rejected is not None:
+                    rejected.append(lineno)
+                continue
+            yield ts, row[1].strip(), h
+
+# Ejemplo
+if __name__ == "__main__":
+    initialize()
+    print("Modelo listo. (sklearn disponible: {} )".format(SKLEARN_AVAILABLE))
+    while True:
+        entrada = input("Altura medida (pulgadas, q para salir): ")
+        if entrada.lower().startswith("q"):
+            break
+        try:
+            h = float(entrada)
+        except ValueError:
+            print("Entrada no válida. Introduce un número o 'q' para salir.")
+            continue
+        g = galones_ml(h)
+        print(f"Altura = {h:.3f} in  →  {g:.1f} galones (modelo ML)")
@@ -206,8 +206,8 @@ class TankApp(App):
         self.current_tank_id = None
         
     def build(self):
-        # Cargar configuración de tanques
-        calculo.load_tanks_config()
+        # Cargar configuración de tanques (una sola vez; importar calculo no la carga)
+        calculo.initialize()
         self.current_tank_id = calculo._current_tank_id
         
         # Layout principal con padding mejorado
@@ -404,6 +404,14 @@ class TankApp(App):
         
         return main_layout
     
+    def on_pause(self):
+        # Android puede cerrar la app en pausa: escribir los cambios pendientes
+        calculo.flush()
+        return True
+    
+    def on_stop(self):
+        calculo.flush()
+    
     def _update_header_bg(self, instance, value):
         self.header_bg.pos = instance.pos
         self.header_bg.size = instance.size
@@ -688,7 +696,8 @@ class TankApp(App):
                     self.show_error('Error', 'Los valores deben ser positivos')
                     return
                 
-                calculo.append_training_points([h], [g])
+                # Reentrenar en segundo plano para no bloquear la interfaz
+                calculo.append_training_points([h], [g], background=True)
                 
                 popup.dismiss()
                 self.show_info('✅ Calibrado', f'Punto agregado:\n{h:.1f}" = {g:.2f} gal\n\nTotal puntos: {len(tank["_training_heights"]) + 1}')
@@ -736,7 +745,9 @@ class TankApp(App):
         tank_list_layout = BoxLayout(orientation='vertical', spacing=8, size_hint_y=None, padding=[5, 5])
         tank_list_layout.bind(minimum_height=tank_list_layout.setter('height'))
         
-        for tank_id, tank in calculo._tanks.items():
+        # get_tank_list no carga los datos de cada tanque (config por shards)
+        for tank in calculo.get_tank_list():
+            tank_id = tank['id']
             tank_card = BoxLayout(orientation='vertical', size_hint_y=None, height=80, spacing=5)
             
             # Nombre y dimensiones
@@ -750,7 +761,7 @@ class TankApp(App):
             info_line.bind(size=info_line.setter('text_size'))
             
             details_line = Label(
-                text=f"⌀ {tank['D']:.1f}\" × 📏 {tank['L']:.1f}\" | 📊 {len(tank['_training_heights'])} puntos",
+                text=f"⌀ {tank['diameter']:.1f}\" × 📏 {tank['length']:.1f}\" | 📊 {tank['points']} puntos",
                 font_size='12sp',
                 color=TEXT_GRAY,
                 halign='left'